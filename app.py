@@ -1,4 +1,4 @@
-from gevent import monkey
+from gevent import monkey, get_hub
 monkey.patch_all()
 
 # Załaduj zmienne środowiskowe z pliku .env
@@ -6,15 +6,110 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
+import atexit
+import logging
+import logging.handlers
 import random
 import json
-from flask import Flask, render_template, request, jsonify, url_for, session, redirect
+import time
+import math
+import io
+import zipfile
+from array import array
+from flask import Flask, render_template, request, jsonify, url_for, session, redirect, has_app_context, send_file
 from flask_sqlalchemy import SQLAlchemy
 from flask_socketio import SocketIO, emit, join_room
-from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.attributes import set_committed_value
+from datetime import datetime
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from functools import wraps
+from functools import wraps, partial
+from contextlib import nullcontext
+from sortedcontainers import SortedList
+from qr_render import (QRCODE_AVAILABLE, REUSABLE_QR_CODES, ONE_TIME_QR_PREFIXES, qr_identifiers, qr_label,
+                       cached_qr_image, render_sheet_page, pages_to_pdf)
+
+# --- Logowanie ---
+# Loggery 'saper.<podsystem>' (app, db, state, game, scan, timer, socket, ai, ar) wrzucają
+# rekordy do kolejki, a zapis na stdout robi osobny wątek systemowy (nie greenlet) -
+# żądania i pętla zegara nie czekają na I/O logów. Poziomy: LOG_LEVEL dla wszystkich
+# i LOG_LEVEL_<PODSYSTEM> (np. LOG_LEVEL_SCAN=DEBUG). LOG_FORMAT=json (domyślnie) albo
+# text. Komunikaty z każdego ticku zegara logowane są co TICK_LOG_SAMPLE_EVERY ticków.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json').lower()
+TICK_LOG_SAMPLE_EVERY = max(1, int(os.environ.get('TICK_LOG_SAMPLE_EVERY', 30)))
+LOG_DEFAULT_LEVELS = {'socket': 'WARNING'}  # socketio loguje każdy emit na INFO
+
+class JsonLogFormatter(logging.Formatter):
+    """Jeden rekord = jedna linia JSON"""
+    def format(self, record):
+        entry = {
+            'ts': datetime.utcfromtimestamp(record.created).isoformat(timespec='milliseconds') + 'Z',
+            'level': record.levelname,
+            'logger': record.name,
+            'pid': record.process,
+            'msg': record.getMessage()
+        }
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+_log_queue = monkey.get_original('queue', 'SimpleQueue')()
+_log_writer_done = monkey.get_original('_thread', 'allocate_lock')()
+
+def _log_writer(handler):
+    with _log_writer_done:
+        while True:
+            record = _log_queue.get()
+            if record is None:
+                break
+            handler.handle(record)
+
+def _stop_log_writer():
+    _log_queue.put(None)
+    _log_writer_done.acquire(timeout=2)
+
+def _init_logging():
+    handler = logging.StreamHandler()
+    # blokada z prawdziwego _thread (pisze wątek systemowy, nie greenlet); None psuło reinit po fork()
+    handler.lock = monkey.get_original('_thread', 'RLock')()
+    handler.setFormatter(JsonLogFormatter() if LOG_FORMAT == 'json'
+                         else logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    root = logging.getLogger('saper')
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(logging.handlers.QueueHandler(_log_queue))
+    root.propagate = False
+    monkey.get_original('_thread', 'start_new_thread')(_log_writer, (handler,))
+    atexit.register(_stop_log_writer)
+
+def get_logger(subsystem):
+    logger = logging.getLogger(f'saper.{subsystem}')
+    level = os.environ.get(f'LOG_LEVEL_{subsystem.upper()}', LOG_DEFAULT_LEVELS.get(subsystem))
+    if level:
+        logger.setLevel(level.upper())
+    return logger
+
+_log_sample_counters = {}
+
+def log_sampled(logger, key, level, msg, *args, every=TICK_LOG_SAMPLE_EVERY):
+    """Loguje co every-te wywołanie dla danego klucza (np. tick zegara jednego eventu)"""
+    if not logger.isEnabledFor(level):
+        return
+    count = _log_sample_counters.get(key, 0)
+    _log_sample_counters[key] = count + 1
+    if count % every == 0:
+        logger.log(level, msg, *args)
+
+_init_logging()
+log = get_logger('app')
+db_log = get_logger('db')
+state_log = get_logger('state')
+game_log = get_logger('game')
+scan_log = get_logger('scan')
+timer_log = get_logger('timer')
+ai_log = get_logger('ai')
+ar_log = get_logger('ar')
 
 # Import dla Claude API
 try:
@@ -22,7 +117,7 @@ try:
     ANTHROPIC_AVAILABLE = True
 except ImportError:
     ANTHROPIC_AVAILABLE = False
-    print("⚠️  anthropic package not installed. AI question generation will be limited.")
+    ai_log.warning("⚠️  anthropic package not installed. AI question generation will be limited.")
 
 # Import dla rozpoznawania obrazów AR
 try:
@@ -34,7 +129,10 @@ try:
     CV2_AVAILABLE = True
 except ImportError:
     CV2_AVAILABLE = False
-    print("⚠️  opencv-python not installed. AR features will be limited.")
+    ar_log.warning("⚠️  opencv-python not installed. AR features will be limited.")
+
+if not QRCODE_AVAILABLE:
+    log.warning("⚠️  qrcode/Pillow not installed. Server-side QR images will be unavailable.")
 
 # Inicjalizacja
 app = Flask(__name__)
@@ -59,14 +157,30 @@ app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 db = SQLAlchemy(app)
 
 # Konfiguracja SocketIO
+# SOCKETIO_MESSAGE_QUEUE (lub REDIS_URL) = redis://... włącza tryb wielu workerów:
+# emity z dowolnego procesu (handlery HTTP, pętla zegara) idą przez Redis do wszystkich.
+# Wymagania sesji - patrz DEPLOYMENT.md.
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or os.environ.get('REDIS_URL')
+SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'saper-socketio')
+# Klienci łączą się od razu po WebSocket (bez long-pollingu) - wtedy load balancer
+# nie musi kierować kolejnych żądań tej samej sesji do tego samego workera
+SOCKETIO_WEBSOCKET_ONLY = os.environ.get('SOCKETIO_WEBSOCKET_ONLY', 'False').lower() == 'true'
+
 socketio = SocketIO(app, 
                     async_mode='gevent', 
                     cors_allowed_origins="*", 
                     manage_session=True,
                     engineio_logger=False,
-                    logger=True,
+                    logger=get_logger('socket'),
                     ping_timeout=60,
-                    ping_interval=25)
+                    ping_interval=25,
+                    message_queue=SOCKETIO_MESSAGE_QUEUE,
+                    channel=SOCKETIO_CHANNEL)
+
+@app.context_processor
+def inject_socketio_client_options():
+    """Opcje io() dla szablonów"""
+    return {'socketio_client_options': {'transports': ['websocket']} if SOCKETIO_WEBSOCKET_ONLY else {}}
 
 
 # --- Modele Danych ---
@@ -98,13 +212,18 @@ class Player(db.Model):
     warnings = db.Column(db.Integer, default=0)
     revealed_letters = db.Column(db.String(100), default='')
     event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
+    __table_args__ = (db.Index('ix_player_event_score', 'event_id', 'score'),)
 
 class PlayerAnswer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     player_id = db.Column(db.Integer, db.ForeignKey('player.id', ondelete='CASCADE'), nullable=False)
     question_id = db.Column(db.Integer, db.ForeignKey('question.id', ondelete='CASCADE'), nullable=False)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
-    
+    __table_args__ = (
+        db.Index('ix_player_answer_player', 'player_id'),
+        db.Index('ix_player_answer_event_question', 'event_id', 'question_id'),
+    )
+
 class Question(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     text = db.Column(db.String(255), nullable=False)
@@ -118,6 +237,7 @@ class Question(db.Model):
     difficulty = db.Column(db.String(20), nullable=False, default='easy')
     times_shown = db.Column(db.Integer, default=0)
     times_correct = db.Column(db.Integer, default=0)
+    __table_args__ = (db.Index('ix_question_event_category', 'event_id', 'category'),)
 
 class QRCode(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -125,6 +245,7 @@ class QRCode(db.Model):
     color = db.Column(db.String(20), nullable=False, default='white')
     claimed_by_player_id = db.Column(db.Integer, db.ForeignKey('player.id'), nullable=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
+    __table_args__ = (db.Index('ix_qr_code_event_identifier', 'event_id', 'code_identifier'),)
 
 class PlayerScan(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -133,6 +254,7 @@ class PlayerScan(db.Model):
     scan_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
     color_category = db.Column(db.String(20), nullable=True)
+    __table_args__ = (db.Index('ix_player_scan_player_color_time', 'player_id', 'color_category', 'scan_time'),)
 
 class FunnyPhoto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -158,6 +280,23 @@ class GameState(db.Model):
     value = db.Column(db.String(255), nullable=False)
     __table_args__ = (db.UniqueConstraint('event_id', 'key', name='_event_key_uc'),)
 
+class MinigameProgress(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    player_id = db.Column(db.Integer, db.ForeignKey('player.id', ondelete='CASCADE'), nullable=False)
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
+    game_type = db.Column(db.String(20), nullable=False)
+    score = db.Column(db.Integer, default=0)
+    completed_at = db.Column(db.DateTime, nullable=True)
+    __table_args__ = (db.UniqueConstraint('event_id', 'player_id', 'game_type', name='_event_player_minigame_uc'),)
+
+class EventStats(db.Model):
+    # Liczniki utrzymywane przyrostowo - get_full_game_state() nie liczy ich od nowa
+    event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), primary_key=True)
+    player_count = db.Column(db.Integer, default=0, nullable=False)
+    question_count = db.Column(db.Integer, default=0, nullable=False)
+    answer_count = db.Column(db.Integer, default=0, nullable=False)
+    answered_question_count = db.Column(db.Integer, default=0, nullable=False)
+
 class AICategory(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     event_id = db.Column(db.Integer, db.ForeignKey('event.id', ondelete='CASCADE'), nullable=False)
@@ -179,6 +318,7 @@ class AIQuestion(db.Model):
     source = db.Column(db.String(20), default='generated')
     times_shown = db.Column(db.Integer, default=0)
     times_correct = db.Column(db.Integer, default=0)
+    __table_args__ = (db.Index('ix_ai_question_category_event', 'category_id', 'event_id'),)
 
 class AIPlayerAnswer(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -197,26 +337,108 @@ class ARObject(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class SchemaMigration(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+# --- Migracje schematu ---
+# Każda migracja ma numer wersji i jest idempotentna. Zastosowane wersje
+# zapisywane są w tabeli schema_migration. Uruchomienie: flask migrate-db
+def _migration_question_columns():
+    """Kolumny pytań dodawane wcześniej ręcznie przez /fix-db-columns-v2"""
+    existing_columns = {c['name'] for c in db.inspect(db.engine).get_columns('question')}
+    columns = [
+        ('category', "VARCHAR(50) DEFAULT 'company'"),
+        ('difficulty', "VARCHAR(20) DEFAULT 'easy'"),
+        ('times_shown', 'INTEGER DEFAULT 0'),
+        ('times_correct', 'INTEGER DEFAULT 0'),
+    ]
+    for name, ddl in columns:
+        if name not in existing_columns:
+            db.session.execute(db.text(f'ALTER TABLE question ADD COLUMN {name} {ddl}'))
+
+def _migration_hot_path_indexes():
+    """Indeksy złożone dla zapytań z gorących ścieżek (skan, odpowiedź, ranking).
+    Brak kolumn indeksu przerywa migrację - wersja nie zostaje zapisana i kolejne
+    uruchomienie spróbuje ponownie (po uzupełnieniu schematu)."""
+    inspector = db.inspect(db.session.connection())
+    skipped = []
+    for table in db.Model.metadata.sorted_tables:
+        if not table.indexes:
+            continue
+        existing_columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for index in table.indexes:
+            missing_columns = [c.name for c in index.columns if c.name not in existing_columns]
+            if missing_columns:
+                skipped.append(f"{index.name} ({table.name}: brak {', '.join(missing_columns)})")
+                continue
+            index.create(bind=db.session.connection(), checkfirst=True)
+    if skipped:
+        raise RuntimeError(f"Nie można utworzyć indeksów: {'; '.join(skipped)}")
+
+MIGRATIONS = [
+    (1, 'question_columns', _migration_question_columns),
+    (2, 'hot_path_indexes', _migration_hot_path_indexes),
+]
+
+def run_migrations():
+    """Stosuje brakujące migracje po kolei, każdą w osobnej transakcji. Zwraca listę nazw."""
+    SchemaMigration.__table__.create(bind=db.engine, checkfirst=True)
+    applied_versions = {m.version for m in SchemaMigration.query.all()}
+    applied = []
+    for version, name, migrate in MIGRATIONS:
+        if version in applied_versions:
+            continue
+        try:
+            migrate()
+            db.session.add(SchemaMigration(version=version, name=name))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        applied.append(f'{version:04d}_{name}')
+    return applied
+
+def find_missing_indexes():
+    """Zwraca listę 'tabela.indeks' zdefiniowanych w modelach, których brakuje w bazie"""
+    inspector = db.inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    missing = []
+    for table in db.Model.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                missing.append(f'{table.name}.{index.name}')
+    return missing
+
 # Inicjalizacja bazy danych przy starcie aplikacji
 with app.app_context():
     try:
         db.create_all()
+        missing_indexes = find_missing_indexes()
+        if missing_indexes:
+            db_log.warning("⚠️  Brakujące indeksy (%d): %s. Uruchom 'flask migrate-db', aby je utworzyć.",
+                           len(missing_indexes), ', '.join(missing_indexes))
         if not Admin.query.first():
             admin = Admin(login='admin')
             admin.set_password('admin')
             db.session.add(admin)
-            print("Default admin created.")
+            db_log.info("Default admin created.")
         
         if not Event.query.first():
             event = Event(id=1, login='host1', name='Event #1', password_plain='password1')
             event.set_password('password1')
             db.session.add(event)
-            print("Default event created.")
+            db_log.info("Default event created.")
         
         db.session.commit()
-        print("Database tables checked/created successfully.")
+        db_log.info("Database tables checked/created successfully.")
     except Exception as e:
-        print(f"Database initialization error: {e}")
+        db_log.error("Database initialization error: %s", e)
 
 
 # --- Dekoratory Autoryzacji ---
@@ -254,7 +476,27 @@ def init_db_command():
         event.set_password('password1')
         db.session.add(event)
     db.session.commit()
+    applied = run_migrations()
     print("Database initialized.")
+    if applied:
+        print(f"Applied migrations: {', '.join(applied)}")
+
+@app.cli.command("migrate-db")
+def migrate_db_command():
+    """Stosuje brakujące migracje schematu (kolumny, indeksy)."""
+    db.create_all()
+    try:
+        applied = run_migrations()
+    except RuntimeError as e:
+        print(f"Migration failed: {e}")
+        raise SystemExit(1)
+    if applied:
+        print(f"Applied migrations: {', '.join(applied)}")
+    else:
+        print("Database schema is up to date.")
+    missing_indexes = find_missing_indexes()
+    if missing_indexes:
+        print(f"Still missing indexes: {', '.join(missing_indexes)}")
 
 
 # --- Funkcje Pomocnicze ---
@@ -287,27 +529,28 @@ def init_default_ai_categories(event_id):
 
     try:
         db.session.commit()
+        invalidate_event_catalog(event_id)
     except Exception as e:
         db.session.rollback()
-        print(f"Error initializing AI categories: {e}")
+        db_log.error("Error initializing AI categories: %s", e)
 
 def generate_ai_questions_with_claude(category_name, difficulty_level='easy', count=10):
     """Generuje pytania AI przy użyciu Claude API"""
-    print(f"🤖 Attempting to generate {count} AI questions for category: {category_name}")
+    ai_log.info("🤖 Attempting to generate %s AI questions for category: %s", count, category_name)
 
     if not ANTHROPIC_AVAILABLE:
         error_msg = 'Claude API nie jest dostępne. Zainstaluj pakiet anthropic.'
-        print(f"❌ {error_msg}")
+        ai_log.error("❌ %s", error_msg)
         return {'error': error_msg}
 
     api_key = os.environ.get('ANTHROPIC_API_KEY')
     if not api_key:
         error_msg = 'Brak klucza API dla Claude. Ustaw zmienną środowiskową ANTHROPIC_API_KEY w konfiguracji serwera.'
-        print(f"❌ {error_msg}")
-        print(f"ℹ️  Dostępne zmienne środowiskowe: {', '.join([k for k in os.environ.keys() if 'ANTHROPIC' in k.upper() or 'API' in k.upper()])}")
+        ai_log.error("❌ %s", error_msg)
+        ai_log.info("ℹ️  Dostępne zmienne środowiskowe: %s", ', '.join([k for k in os.environ.keys() if 'ANTHROPIC' in k.upper() or 'API' in k.upper()]))
         return {'error': error_msg}
 
-    print(f"✅ API key found (length: {len(api_key)}, starts with: {api_key[:10]}...)")
+    ai_log.debug("✅ API key found (length: %d, starts with: %s...)", len(api_key), api_key[:10])
 
     difficulty_mapping = {
         'easy': 'łatwy (podstawowa wiedza ogólna)',
@@ -339,10 +582,10 @@ Zwróć odpowiedź w formacie JSON (tylko czysty JSON, bez żadnego dodatkowego
 WAŻNE: Pytania muszą być w języku polskim i odpowiednie do poziomu trudności."""
 
     try:
-        print(f"📡 Connecting to Claude API...")
+        ai_log.debug("📡 Connecting to Claude API...")
         client = anthropic.Anthropic(api_key=api_key)
 
-        print(f"🔄 Sending request to Claude API...")
+        ai_log.debug("🔄 Sending request to Claude API...")
         message = client.messages.create(
             model="claude-sonnet-4-5-20250929",
             max_tokens=4000,
@@ -352,7 +595,7 @@ WAŻNE: Pytania muszą być w języku polskim i odpowiednie do poziomu trudnośc
             }]
         )
 
-        print(f"✅ Received response from Claude API")
+        ai_log.debug("✅ Received response from Claude API")
 
         # Wyciągnij treść odpowiedzi
         response_text = message.content[0].text.strip()
@@ -370,78 +613,1123 @@ WAŻNE: Pytania muszą być w języku polskim i odpowiednie do poziomu trudnośc
         # Parse JSON
         questions = json.loads(response_text)
 
-        print(f"✅ Successfully generated {len(questions)} questions")
+        ai_log.info("✅ Successfully generated %d questions", len(questions))
         return {'success': True, 'questions': questions}
 
     except Exception as e:
         error_type = type(e).__name__
         error_msg = str(e)
-        print(f"❌ Error generating AI questions [{error_type}]: {error_msg}")
-        import traceback
-        traceback.print_exc()
+        ai_log.exception("❌ Error generating AI questions [%s]: %s", error_type, error_msg)
         return {'error': f'Błąd podczas generowania pytań: {error_msg}'}
 
+# --- Cache stanu gry (GameState) ---
+# Wszystkie klucze eventu ładowane są jednym zapytaniem i trzymane w pamięci.
+# set_game_state() aktualizuje cache po commicie (write-through), a pozostałe
+# workery dostają unieważnienie przez zarejestrowane funkcje publikujące.
+STATE_CACHE_TTL = float(os.environ.get('STATE_CACHE_TTL', 30))
+
+_game_state_cache = {}       # event_id -> {'values': {key: value}, 'loaded_at': monotonic}
+_game_state_generation = {}  # event_id -> licznik zmian (chroni przed zapisem starego snapshotu)
+_state_cache_publishers = []
+
+def _state_cache_key(event_id):
+    try:
+        return int(event_id)
+    except (TypeError, ValueError):
+        return event_id
+
+def register_state_cache_publisher(callback):
+    """Rejestruje funkcję callback(event_id, kind, data) rozgłaszającą zmiany do innych procesów.
+
+    kind: 'state' (stan gry), 'score' (data = [player_id, name, score]),
+    'player_removed' (data = player_id), 'leaderboard' (ranking eventu do przebudowy),
+    'questions' (zmieniła się liczba pytań - pułap punktów hasła)."""
+    _state_cache_publishers.append(callback)
+
+def _publish_state_change(event_id, kind='state', data=None):
+    for callback in _state_cache_publishers:
+        try:
+            callback(event_id, kind, data)
+        except Exception as e:
+            state_log.error("Błąd publikacji unieważnienia cache stanu: %s", e)
+
+def invalidate_game_state_cache(event_id=None, broadcast=True):
+    """Unieważnia cache stanu jednego eventu (lub wszystkich, gdy event_id=None)"""
+    if event_id is None:
+        for cached_id in list(_game_state_cache):
+            _game_state_generation[cached_id] = _game_state_generation.get(cached_id, 0) + 1
+        _game_state_cache.clear()
+    else:
+        event_id = _state_cache_key(event_id)
+        _game_state_generation[event_id] = _game_state_generation.get(event_id, 0) + 1
+        _game_state_cache.pop(event_id, None)
+    if broadcast:
+        _publish_state_change(event_id)
+
+def load_game_state(event_id):
+    """Zwraca słownik {klucz: wartość} całego stanu eventu - jedno zapytanie, potem z pamięci"""
+    event_id = _state_cache_key(event_id)
+    cached = _game_state_cache.get(event_id)
+    now = time.monotonic()
+    if cached is not None and (STATE_CACHE_TTL <= 0 or now - cached['loaded_at'] < STATE_CACHE_TTL):
+        return cached['values']
+
+    generation = _game_state_generation.get(event_id, 0)
+    rows = db.session.query(GameState.key, GameState.value).filter_by(event_id=event_id).all()
+    values = {key: value for key, value in rows}
+    # Nie nadpisuj cache, jeśli w trakcie zapytania ktoś zmienił stan tego eventu
+    if _game_state_generation.get(event_id, 0) == generation:
+        _game_state_cache[event_id] = {'values': values, 'loaded_at': now}
+    return values
+
+def load_active_game_states():
+    """Zwraca {event_id: stan} wszystkich aktywnych eventów jednym zapytaniem i odświeża nimi cache"""
+    generations = dict(_game_state_generation)
+    active_event_ids = db.session.query(GameState.event_id).filter_by(key='game_active', value='True')
+    rows = db.session.query(GameState.event_id, GameState.key, GameState.value).filter(
+        GameState.event_id.in_(active_event_ids.scalar_subquery())
+    ).all()
+
+    states = {}
+    for event_id, key, value in rows:
+        states.setdefault(event_id, {})[key] = value
+
+    now = time.monotonic()
+    for event_id, values in states.items():
+        if _game_state_generation.get(event_id, 0) == generations.get(event_id, 0):
+            _game_state_cache[event_id] = {'values': values, 'loaded_at': now}
+        else:
+            states[event_id] = load_game_state(event_id)
+    return states
+
 def get_game_state(event_id, key, default=None):
-    state = GameState.query.filter_by(event_id=event_id, key=key).first()
-    return state.value if state else default
+    return load_game_state(event_id).get(key, default)
+
+def update_game_state(event_id, values):
+    """Zapisuje wiele kluczy stanu jednym upsertem i jednym commitem.
+
+    Commit obejmuje też zmiany oczekujące w sesji (np. usunięcia w start_game)."""
+    values = {key: str(value) for key, value in values.items()}
+    if values:
+        rows = [{'event_id': event_id, 'key': key, 'value': value} for key, value in values.items()]
+        dialect = db.engine.dialect.name
+        if dialect in ('postgresql', 'sqlite'):
+            insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+            stmt = insert(GameState.__table__).values(rows)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['event_id', 'key'],
+                set_={'value': stmt.excluded.value}
+            )
+            db.session.execute(stmt)
+        else:
+            existing = {s.key: s for s in GameState.query.filter(
+                GameState.event_id == event_id, GameState.key.in_(list(values))
+            ).all()}
+            for key, value in values.items():
+                if key in existing: existing[key].value = value
+                else: db.session.add(GameState(event_id=event_id, key=key, value=value))
+    db.session.commit()
+
+    cache_key = _state_cache_key(event_id)
+    _game_state_generation[cache_key] = _game_state_generation.get(cache_key, 0) + 1
+    cached = _game_state_cache.get(cache_key)
+    if cached is not None:
+        cached['values'].update(values)
+    _publish_state_change(cache_key)
 
 def set_game_state(event_id, key, value):
-    state = GameState.query.filter_by(event_id=event_id, key=key).first()
-    if state: state.value = str(value)
-    else: db.session.add(GameState(event_id=event_id, key=key, value=str(value)))
+    update_game_state(event_id, {key: value})
+
+# Unieważnianie cache między workerami przez Redis pub/sub (gdy skonfigurowana kolejka)
+STATE_CACHE_CHANNEL = os.environ.get('STATE_CACHE_CHANNEL', 'saper-state-cache')
+_process_id = f"{os.getpid()}-{random.getrandbits(32):08x}"
+_redis_client = None
+
+def _get_redis_client():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(SOCKETIO_MESSAGE_QUEUE)
+    return _redis_client
+
+def _publish_state_change_redis(event_id, kind='state', data=None):
+    message = json.dumps({'sender': _process_id, 'event_id': event_id, 'kind': kind, 'data': data})
+    _get_redis_client().publish(STATE_CACHE_CHANNEL, message)
+
+def listen_state_cache_invalidations():
+    """Background task: unieważnia lokalny cache po zmianach stanu w innych workerach"""
+    while True:
+        try:
+            pubsub = _get_redis_client().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(STATE_CACHE_CHANNEL)
+            state_log.info("📡 Nasłuch unieważnień cache stanu (%s)", STATE_CACHE_CHANNEL)
+            for message in pubsub.listen():
+                data = json.loads(message['data'])
+                if data.get('sender') != _process_id:
+                    _apply_remote_change(data.get('event_id'), data.get('kind', 'state'), data.get('data'))
+        except Exception as e:
+            state_log.error("❌ Błąd nasłuchu unieważnień cache: %s", e)
+        # Po zerwaniu połączenia część zmian mogła przepaść - zacznij od czystego cache
+        invalidate_game_state_cache(broadcast=False)
+        _leaderboards.clear()
+        socketio.sleep(2)
+
+if SOCKETIO_MESSAGE_QUEUE:
+    register_state_cache_publisher(_publish_state_change_redis)
+
+def recompute_event_stats(event_id):
+    """Przelicza liczniki eventu od zera (po operacjach hurtowych). Nie robi commita."""
+    stats = db.session.get(EventStats, event_id)
+    if not stats:
+        stats = EventStats(event_id=event_id)
+        db.session.add(stats)
+    stats.player_count = Player.query.filter_by(event_id=event_id).count()
+    stats.question_count = Question.query.filter_by(event_id=event_id).count()
+    stats.answer_count = PlayerAnswer.query.filter_by(event_id=event_id).count()
+    stats.answered_question_count = db.session.query(
+        db.func.count(db.distinct(PlayerAnswer.question_id))
+    ).filter(PlayerAnswer.event_id == event_id).scalar() or 0
+    return stats
+
+def bump_event_stats(event_id, **deltas):
+    """Atomowo zmienia liczniki eventu (UPDATE ... SET x = x + n). Nie robi commita."""
+    values = {getattr(EventStats, name): getattr(EventStats, name) + delta for name, delta in deltas.items() if delta}
+    if not values:
+        return
+    updated = EventStats.query.filter_by(event_id=event_id).update(values, synchronize_session=False)
+    if not updated:
+        # Brak wiersza (np. event sprzed wprowadzenia liczników) - policz wszystko raz
+        recompute_event_stats(event_id)
+
+def add_player_score(player, delta):
+    """Atomowo: score = max(score + delta, 0) jednym UPDATE (bez odczytu i flusha obiektu Player).
+    Zwraca nowy wynik i ustawia go w obiekcie jako wartość z bazy. Nie robi commita."""
+    table = Player.__table__
+    floor = db.func.greatest if db.engine.dialect.name == 'postgresql' else db.func.max
+    stmt = table.update().where(table.c.id == player.id).values(
+        score=floor(db.func.coalesce(table.c.score, 0) + delta, 0)
+    )
+    if db.engine.dialect.name == 'postgresql':
+        new_score = db.session.execute(stmt.returning(table.c.score)).scalar()
+    else:
+        # SQLAlchemy 1.4 nie obsługuje RETURNING dla SQLite - odczyt w tej samej transakcji
+        db.session.execute(stmt)
+        new_score = db.session.execute(db.select(table.c.score).where(table.c.id == player.id)).scalar()
+    set_committed_value(player, 'score', new_score)
+    return new_score
+
+# Liczniki statystyk pytań (times_shown / times_correct) nie są zapisywane przy każdej
+# odpowiedzi - zbierają się w pamięci i co QUESTION_COUNTER_FLUSH_INTERVAL s (oraz przy
+# zamykaniu procesu) trafiają do bazy jednym wsadowym UPDATE na model.
+# Endpointy hosta/admina doliczają niezapisane jeszcze przyrosty.
+QUESTION_COUNTER_FLUSH_INTERVAL = float(os.environ.get('QUESTION_COUNTER_FLUSH_INTERVAL', 5))
+QUESTION_COUNTER_FIELDS = ('times_shown', 'times_correct')
+
+_question_counter_buffer = {}  # (nazwa modelu, question_id) -> {'times_shown': n, 'times_correct': n}
+
+def _buffer_question_counters(key, deltas):
+    pending = _question_counter_buffer.setdefault(key, dict.fromkeys(QUESTION_COUNTER_FIELDS, 0))
+    for name, delta in deltas.items():
+        pending[name] += delta
+
+def bump_question_counters(model, question_id, **deltas):
+    """Dolicza przyrosty liczników pytania do bufora (bez zapytania do bazy)"""
+    _buffer_question_counters((model.__name__, question_id), deltas)
+
+def with_pending_counters(model, question):
+    """Wartości liczników pytania razem z niezapisanymi przyrostami"""
+    pending = _question_counter_buffer.get((model.__name__, question.id), {})
+    return {name: (getattr(question, name) or 0) + pending.get(name, 0) for name in QUESTION_COUNTER_FIELDS}
+
+def flush_question_counters():
+    """Zapisuje bufor: jeden UPDATE ... SET x = x + :dx (executemany) na model. Zwraca liczbę pytań."""
+    global _question_counter_buffer
+    if not _question_counter_buffer:
+        return 0
+    buffer, _question_counter_buffer = _question_counter_buffer, {}
+    try:
+        for model in (Question, AIQuestion):
+            rows = [{'question_id': question_id, **deltas}
+                    for (model_name, question_id), deltas in buffer.items() if model_name == model.__name__]
+            if not rows:
+                continue
+            table = model.__table__
+            stmt = table.update().where(table.c.id == db.bindparam('question_id')).values({
+                name: db.func.coalesce(table.c[name], 0) + db.bindparam(name)
+                for name in QUESTION_COUNTER_FIELDS
+            })
+            db.session.execute(stmt, rows)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Nie gub przyrostów - wróć je do bufora na następną próbę
+        for key, deltas in buffer.items():
+            _buffer_question_counters(key, deltas)
+        raise
+    return len(buffer)
+
+def flush_write_buffers_periodically():
+    """Background task: okresowy zapis bufora liczników pytań i dziennika skanów"""
+    while True:
+        socketio.sleep(QUESTION_COUNTER_FLUSH_INTERVAL)
+        try:
+            with app.app_context():
+                flush_question_counters()
+        except Exception as e:
+            db_log.error("❌ Błąd zapisu liczników pytań: %s", e)
+        try:
+            with app.app_context():
+                flush_player_scans()
+        except Exception as e:
+            db_log.error("❌ Błąd zapisu skanów graczy: %s", e)
+
+def _flush_write_buffers_at_exit():
+    try:
+        with app.app_context():
+            flushed = flush_question_counters()
+            scans = flush_player_scans()
+        if flushed:
+            db_log.info("💾 Zapisano liczniki %d pytań przy zamykaniu", flushed)
+        if scans:
+            db_log.info("💾 Zapisano %d skanów graczy przy zamykaniu", scans)
+    except Exception as e:
+        db_log.error("❌ Błąd zapisu buforów przy zamykaniu: %s", e)
+
+atexit.register(_flush_write_buffers_at_exit)
+
+def get_event_stats(event_id):
+    stats = db.session.get(EventStats, event_id)
+    if not stats:
+        stats = recompute_event_stats(event_id)
+        db.session.commit()
+    return stats
+
+def get_minigame_progress(event_id, player_id):
+    """Zwraca {game_type: score} ze wszystkich minigier gracza - jedno zapytanie"""
+    rows = db.session.query(MinigameProgress.game_type, MinigameProgress.score).filter_by(
+        event_id=event_id, player_id=player_id
+    ).all()
+    return {game_type: score or 0 for game_type, score in rows}
+
+def add_minigame_progress(event_id, player_id, game_type, delta):
+    """Atomowo dolicza punkty do postępu gracza w minigrze jednym upsertem - równoczesne
+    zakończenia gry nie gubią punktów ani nie wpadają na unikalny klucz. Zwraca
+    (nowy wynik, completed_at). Nie robi commita."""
+    table = MinigameProgress.__table__
+    where = (table.c.event_id == event_id, table.c.player_id == player_id, table.c.game_type == game_type)
+    dialect = db.engine.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        insert = pg_insert if dialect == 'postgresql' else sqlite_insert
+        stmt = insert(table).values(event_id=event_id, player_id=player_id, game_type=game_type, score=delta)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['event_id', 'player_id', 'game_type'],
+            set_={'score': db.func.coalesce(table.c.score, 0) + stmt.excluded.score}
+        )
+        db.session.execute(stmt)
+    else:
+        increment = table.update().where(*where).values(score=db.func.coalesce(table.c.score, 0) + delta)
+        if not db.session.execute(increment).rowcount:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(table.insert().values(
+                        event_id=event_id, player_id=player_id, game_type=game_type, score=delta))
+            except IntegrityError:
+                # Wiersz dodał w międzyczasie równoległy request - doliczamy do niego
+                db.session.execute(increment)
+    return db.session.execute(db.select(table.c.score, table.c.completed_at).where(*where)).first()
+
+def mark_minigame_completed(event_id, player_id, game_type):
+    """Ustawia completed_at tylko przy pierwszym ukończeniu. Nie robi commita."""
+    table = MinigameProgress.__table__
+    db.session.execute(table.update().where(
+        table.c.event_id == event_id, table.c.player_id == player_id,
+        table.c.game_type == game_type, table.c.completed_at.is_(None)
+    ).values(completed_at=datetime.utcnow()))
+
+def clear_minigame_progress(event_id):
+    """Usuwa postęp minigier eventu (również stare klucze minigame_*_score_* w GameState)"""
+    MinigameProgress.query.filter_by(event_id=event_id).delete()
+    return GameState.query.filter(
+        GameState.event_id == event_id,
+        GameState.key.like('minigame\\_%\\_score\\_%', escape='\\')
+    ).delete(synchronize_session=False)
+
+# --- Rejestr minigier ---
+# Jedna lista opisuje wszystkie minigry: nazwa (game_type), etykieta, ikona i próg
+# ukończenia. Flagi wyłączenia są w GameState ('minigame_<nazwa>_disabled', domyślnie
+# gra włączona), postęp gracza w MinigameProgress - dostępność gier przy skanie
+# zielonego kodu liczona jest jednym przejściem po rejestrze (stan z cache + jedno
+# zapytanie o postęp), niezależnie od liczby minigier.
+class Minigame:
+    __slots__ = ('name', 'label', 'icon', 'threshold')
+
+    def __init__(self, name, label, icon, threshold=20):
+        self.name = name
+        self.label = label
+        self.icon = icon
+        self.threshold = threshold
+
+    @property
+    def disabled_key(self):
+        return f'minigame_{self.name}_disabled'
+
+MINIGAMES = (
+    Minigame('tetris', 'Tetris', '🎮'),
+    Minigame('arkanoid', 'Arkanoid', '🏓'),
+    Minigame('snake', 'Snake', '🐍'),
+    Minigame('pacman', 'PacMan', '👻'),
+    Minigame('trex', 'T-Rex', '🦖'),
+)
+MINIGAMES_BY_NAME = {game.name: game for game in MINIGAMES}
+
+def minigames_enabled(event_id):
+    """{nazwa: czy włączona} dla wszystkich minigier eventu"""
+    state = load_game_state(event_id)
+    return {game.name: state.get(game.disabled_key, 'False') != 'True' for game in MINIGAMES}
+
+def resolve_minigame_eligibility(event_id, player_id):
+    """Minigry, w które gracz może zagrać: ([(minigra, wynik)], komunikat gdy lista pusta)"""
+    enabled = minigames_enabled(event_id)
+    if not any(enabled.values()):
+        return [], 'Wszystkie minigry zostały wyłączone przez organizatora.'
+    progress = get_minigame_progress(event_id, player_id)
+    available, all_completed = [], True
+    for game in MINIGAMES:
+        score = progress.get(game.name, 0)
+        if score >= game.threshold:
+            continue
+        all_completed = False
+        if enabled[game.name]:
+            available.append((game, score))
+    if all_completed:
+        return [], 'Ukończyłeś już wszystkie minigry! Świetna robota!'
+    if not available:
+        return [], 'Brak dostępnych minigier do ukończenia.'
+    return available, None
+
+# --- Ranking w pamięci ---
+# Dla każdego eventu posortowana lista kluczy (-score, player_id): top(n) i rank_of(id)
+# w czasie logarytmicznym, bez ORDER BY po wszystkich graczach przy każdym odczycie.
+# Budowany z bazy przy pierwszym użyciu po starcie procesu, potem aktualizowany
+# po każdej zmianie wyniku (player_score_changed / player_removed / drop_leaderboard).
+LEADERBOARD_TOP_N = int(os.environ.get('LEADERBOARD_TOP_N', 10))
+
+class RankedLeaderboard:
+    """Ranking jednego eventu (remisy rozstrzyga kolejność rejestracji)"""
+    def __init__(self, rows=()):
+        self._order = SortedList()
+        self._players = {}  # player_id -> (name, score)
+        for player_id, name, score in rows:
+            self.set(player_id, name, score)
+
+    def set(self, player_id, name, score):
+        score = score or 0
+        old = self._players.get(player_id)
+        if old is not None:
+            self._order.remove((-old[1], player_id))
+        self._players[player_id] = (name, score)
+        self._order.add((-score, player_id))
+
+    def remove(self, player_id):
+        old = self._players.pop(player_id, None)
+        if old is not None:
+            self._order.remove((-old[1], player_id))
+
+    def rank_of(self, player_id):
+        entry = self._players.get(player_id)
+        if entry is None:
+            return None
+        return self._order.index((-entry[1], player_id)) + 1
+
+    def top(self, n):
+        """[(player_id, name, score, rank), ...] dla n najlepszych"""
+        return [(player_id, *self._players[player_id], rank)
+                for rank, (_, player_id) in enumerate(self._order.islice(0, n), 1)]
+
+    def __len__(self):
+        return len(self._players)
+
+_leaderboards = {}  # event_id -> RankedLeaderboard
+
+def get_leaderboard(event_id):
+    event_id = int(event_id)
+    board = _leaderboards.get(event_id)
+    if board is None:
+        rows = db.session.query(Player.id, Player.name, Player.score).filter_by(event_id=event_id).all()
+        board = _leaderboards[event_id] = RankedLeaderboard(rows)
+    return board
+
+def drop_leaderboard(event_id, broadcast=True):
+    """Po operacjach hurtowych na graczach - ranking zbuduje się od nowa z bazy"""
+    _leaderboards.pop(int(event_id), None)
+    # Talie pytań i rezerwacje są per gracz, a id usuniętych graczy mogą zostać użyte ponownie
+    _question_decks.pop(int(event_id), None)
+    drop_ai_question_reservations(event_id)
+    if broadcast:
+        _publish_state_change(event_id, 'leaderboard')
+
+def player_score_changed(player):
+    """Po commicie nowego wyniku (albo rejestracji) - aktualizuje ranking i zleca emisję"""
+    get_leaderboard(player.event_id).set(player.id, player.name, player.score)
+    _publish_state_change(player.event_id, 'score', [player.id, player.name, player.score])
+    emit_leaderboard_update(f'event_{player.event_id}')
+
+def player_removed(event_id, player_id):
+    get_leaderboard(event_id).remove(player_id)
+    drop_player_question_decks(event_id, player_id)
+    _publish_state_change(event_id, 'player_removed', player_id)
+    emit_leaderboard_update(f'event_{event_id}')
+
+def _apply_remote_change(event_id, kind, data):
+    """Zmiana ogłoszona przez inny worker"""
+    if kind == 'state':
+        invalidate_game_state_cache(event_id, broadcast=False)
+        return
+    if kind == 'questions':
+        invalidate_question_bank(event_id, broadcast=False)
+        return
+    if kind == 'catalog':
+        invalidate_event_catalog(event_id, broadcast=False)
+        return
+    board = _leaderboards.get(_state_cache_key(event_id))
+    if board is None:
+        return
+    if kind == 'score':
+        board.set(*data)
+    elif kind == 'player_removed':
+        board.remove(data)
+        drop_player_question_decks(event_id, data)
+    else:
+        drop_leaderboard(event_id, broadcast=False)
+        return
+    sync_leaderboard_view(_state_cache_key(event_id), board)
+
+# --- Hasło (odkrywanie liter) ---
+# Wspólna logika odkrywania hasła dla pytań, pytań AI, minigier i panelu hosta.
+# Pułap punktów (liczby pytań) trzymany jest w pamięci i unieważniany przy dodaniu/
+# usunięciu pytań, bonus czytany jest z cache stanu - poprawna odpowiedź nie robi
+# żadnego COUNT(*). Odkryte indeksy to maska bitowa, a tekst do wyświetlenia
+# liczony jest raz na każdą wersję (hasło, odkryte indeksy).
+DEFAULT_GAME_PASSWORD = 'SAPEREVENT'
+
+_question_counts = {}  # event_id -> (liczba pytań, liczba pytań AI)
+_password_views = {}   # event_id -> widok hasła dla (hasło, odkryte indeksy)
+
+def invalidate_question_bank(event_id, broadcast=True):
+    """Po dodaniu/usunięciu pytań lub pytań AI - pułap punktów i talie pytań do przeliczenia"""
+    key = _state_cache_key(event_id)
+    _question_counts.pop(key, None)
+    _question_bank_version[key] = _question_bank_version.get(key, 0) + 1
+    invalidate_event_catalog(event_id, broadcast=False)
+    if broadcast:
+        _publish_state_change(event_id, 'questions')
+
+def max_possible_points(event_id):
+    key = _state_cache_key(event_id)
+    counts = _question_counts.get(key)
+    if counts is None:
+        counts = _question_counts[key] = (
+            Question.query.filter_by(event_id=event_id).count(),
+            AIQuestion.query.filter_by(event_id=event_id).count()
+        )
+    total_questions, total_ai_questions = counts
+    bonus_multiplier = int(get_game_state(event_id, 'bonus_multiplier', '1'))
+    return (total_questions * 10 * bonus_multiplier) + (total_ai_questions * 5)
+
+def _parse_revealed_mask(revealed_indices_str):
+    mask = 0
+    for index in (revealed_indices_str or '').split(','):
+        if index.strip().isdigit():
+            mask |= 1 << int(index)
+    return mask
+
+def _mask_indices(mask):
+    return [i for i in range(mask.bit_length()) if mask >> i & 1]
+
+def password_state(event_id):
+    """{'password', 'mask', 'letters_mask', 'display'} - liczone raz na wersję hasła"""
+    password = get_game_state(event_id, 'game_password', DEFAULT_GAME_PASSWORD)
+    revealed_indices_str = get_game_state(event_id, 'revealed_password_indices', '')
+    key = _state_cache_key(event_id)
+    view = _password_views.get(key)
+    if view is None or view['version'] != (password, revealed_indices_str):
+        # Bity spoza hasła (stary zapis, krótsze nowe hasło) nie liczą się jako odkryte
+        mask = _parse_revealed_mask(revealed_indices_str) & ((1 << len(password)) - 1)
+        letters_mask = sum(1 << i for i, char in enumerate(password) if char != ' ')
+        display = ''.join(
+            '  ' if char == ' ' else (char if mask >> i & 1 else '_')
+            for i, char in enumerate(password)
+        )
+        view = _password_views[key] = {
+            'version': (password, revealed_indices_str),
+            'password': password,
+            'mask': mask,
+            'letters_mask': letters_mask,
+            'display': display
+        }
+    return view
+
+def reveal_password_indices(event_id, indices):
+    """Dopisuje odkryte indeksy; zapisuje stan i zleca emisję tylko przy zmianie.
+    Zwraca listę nowo odkrytych indeksów. Indeks spoza hasła - ValueError."""
+    view = password_state(event_id)
+    password_length = len(view['password'])
+    added = 0
+    for index in indices:
+        try:
+            index = int(index)
+        except (TypeError, ValueError):
+            raise ValueError(f'Nieprawidłowy indeks: {index!r}') from None
+        if not 0 <= index < password_length:
+            raise ValueError(f'Indeks {index} jest poza hasłem (0-{password_length - 1})')
+        added |= 1 << index
+    added &= ~view['mask']
+    if not added:
+        return []
+    set_game_state(event_id, 'revealed_password_indices', ','.join(map(str, _mask_indices(view['mask'] | added))))
+    emit_password_update(f'event_{event_id}')
+    return _mask_indices(added)
+
+def auto_reveal_password(player):
+    """Tryb 'auto': odkrywa tyle liter, ile wynika z wyniku gracza. Zwraca odkryte litery."""
+    event_id = player.event_id
+    if get_game_state(event_id, 'password_reveal_mode', 'auto') != 'auto':
+        return []
+    
+    ceiling = max_possible_points(event_id)
+    reveal_percentage = int(get_game_state(event_id, 'password_reveal_percentage', '50'))
+    if ceiling <= 0 or reveal_percentage <= 0:
+        return []
+    
+    # Próg punktów na jedną literę i ile liter gracz powinien mieć odkrytych
+    points_per_letter = (ceiling * reveal_percentage) / 100
+    letters_to_reveal = int(player.score / points_per_letter)
+    
+    view = password_state(event_id)
+    available_mask = view['letters_mask'] & ~view['mask']
+    current_revealed_count = (view['letters_mask'] & view['mask']).bit_count()
+    letters_to_add = min(letters_to_reveal - current_revealed_count, available_mask.bit_count())
+    if letters_to_add <= 0:
+        return []
+    
+    revealed = reveal_password_indices(event_id, random.sample(_mask_indices(available_mask), letters_to_add))
+    return [view['password'][i] for i in revealed]
+
+# --- Talie pytań ---
+# Zamiast NOT IN (wszystkie odpowiedzi gracza) + ORDER BY random() przy każdym skanie,
+# każdy gracz ma dla kategorii własną talię: permutację id pytań (array, losowaną
+# z ziarnem gracza - ta sama w każdym procesie) i kursor. Pytania, na które gracz
+# już odpowiedział, odpadają z talii przy pierwszym trafieniu (sprawdzenie po indeksie);
+# pominięte bez odpowiedzi wracają po przejściu całej talii.
+# Talia jest budowana od nowa, gdy zmieni się zbiór pytań eventu (invalidate_question_bank).
+_question_bank_version = {}  # event_id -> licznik zmian pytań
+_question_decks = {}         # event_id -> {(model, player_id, kategoria): QuestionDeck}
+
+_DECK_ANSWER_MODELS = {'Question': PlayerAnswer, 'AIQuestion': AIPlayerAnswer}
+
+class QuestionDeck:
+    """Potasowane id pytań jednej kategorii dla jednego gracza"""
+    __slots__ = ('ids', 'cursor', 'version')
+
+    def __init__(self, ids, seed, version):
+        ids = list(ids)
+        random.Random(seed).shuffle(ids)
+        self.ids = array('l', ids)
+        self.cursor = 0
+        self.version = version
+
+    def peek(self):
+        if not self.ids:
+            return None
+        if self.cursor >= len(self.ids):
+            self.cursor = 0
+        return self.ids[self.cursor]
+
+    def advance(self):
+        self.cursor += 1
+
+    def discard_current(self):
+        # Zamiana z ostatnim - O(1), kolejność reszty talii i tak jest losowa
+        self.ids[self.cursor] = self.ids[-1]
+        self.ids.pop()
+
+def _deck_filter(model, event_id, category):
+    if model is AIQuestion:
+        return (AIQuestion.event_id == event_id, AIQuestion.category_id == category)
+    if category is None:
+        return (Question.event_id == event_id,)
+    return (Question.event_id == event_id, Question.category == category)
+
+def get_question_deck(model, event_id, player_id, category):
+    """Talia gracza - tworzona leniwie (id pytań z katalogu eventu + jedno zapytanie o odpowiedzi gracza)"""
+    event_key = _state_cache_key(event_id)
+    version = _question_bank_version.get(event_key, 0)
+    decks = _question_decks.setdefault(event_key, {})
+    key = (model.__name__, player_id, category)
+    deck = decks.get(key)
+    if deck is None or deck.version != version:
+        answer_model = _DECK_ANSWER_MODELS[model.__name__]
+        answered = {question_id for (question_id,) in db.session.query(answer_model.question_id).filter(
+            answer_model.player_id == player_id
+        )}
+        ids = [question_id for question_id in catalog_question_ids(model, event_id, category)
+               if question_id not in answered]
+        deck = decks[key] = QuestionDeck(ids, f'{model.__name__}:{event_id}:{player_id}:{category}', version)
+    return deck
+
+def next_deck_question(model, event_id, player_id, category=None):
+    """Następne pytanie, na które gracz jeszcze nie odpowiedział (albo None)"""
+    deck = get_question_deck(model, event_id, player_id, category)
+    answer_model = _DECK_ANSWER_MODELS[model.__name__]
+    while True:
+        question_id = deck.peek()
+        if question_id is None:
+            return None
+        already_answered = db.session.query(answer_model.id).filter_by(
+            player_id=player_id, question_id=question_id
+        ).first() is not None
+        question = None if already_answered else db.session.get(model, question_id)
+        if question is None:
+            deck.discard_current()
+            continue
+        deck.advance()
+        return question
+
+def drop_player_question_decks(event_id, player_id):
+    decks = _question_decks.get(_state_cache_key(event_id), {})
+    for key in [key for key in decks if key[1] == player_id]:
+        del decks[key]
+    drop_ai_question_reservations(event_id, player_id)
+
+# --- Katalog eventu ---
+# Kody QR (identyfikator -> id, kolor), włączone kategorie AI i listy id pytań zmieniają
+# się tylko przez endpointy CRUD (kody QR nie mogą być generowane podczas gry), więc
+# skan czyta je z katalogu w pamięci. Katalog ładuje się leniwie, część po części,
+# a każda zmiana podnosi wersję eventu (invalidate_event_catalog) - przy następnym
+# odczycie katalog budowany jest od nowa. Stan przydziału kodów jednorazowych
+# (claimed_by_player_id) zmienia się w trakcie gry i nie jest tu trzymany.
+_event_catalog_version = {}  # event_id -> licznik zmian katalogu
+_event_catalogs = {}         # event_id -> {'version': n, 'qr_codes': ..., 'ai_categories': ..., 'question_ids': {...}}
+
+def invalidate_event_catalog(event_id, broadcast=True):
+    """Po zmianie kodów QR, kategorii AI lub pytań eventu"""
+    key = _state_cache_key(event_id)
+    _event_catalog_version[key] = _event_catalog_version.get(key, 0) + 1
+    _event_catalogs.pop(key, None)
+    if broadcast:
+        _publish_state_change(event_id, 'catalog')
+
+def get_event_catalog(event_id):
+    key = _state_cache_key(event_id)
+    version = _event_catalog_version.get(key, 0)
+    catalog = _event_catalogs.get(key)
+    if catalog is None or catalog['version'] != version:
+        catalog = _event_catalogs[key] = {'version': version, 'qr_codes': None, 'ai_categories': None, 'question_ids': {}}
+    return catalog
+
+def catalog_qr_code(event_id, code_identifier):
+    """(id, kolor) kodu QR eventu albo None"""
+    catalog = get_event_catalog(event_id)
+    if catalog['qr_codes'] is None:
+        catalog['qr_codes'] = {
+            identifier: (qr_id, color)
+            for identifier, qr_id, color in db.session.query(
+                QRCode.code_identifier, QRCode.id, QRCode.color
+            ).filter(QRCode.event_id == event_id)
+        }
+    return catalog['qr_codes'].get(code_identifier)
+
+def catalog_ai_categories(event_id):
+    """Włączone kategorie AI eventu (słowniki gotowe do jsonify)"""
+    catalog = get_event_catalog(event_id)
+    if catalog['ai_categories'] is None:
+        catalog['ai_categories'] = [{
+            'id': c.id,
+            'name': c.name,
+            'difficulty_level': c.difficulty_level
+        } for c in AICategory.query.filter_by(event_id=event_id, is_enabled=True).order_by(AICategory.id)]
+    return catalog['ai_categories']
+
+def catalog_question_ids(model, event_id, category):
+    """Id pytań (ręcznych lub AI) z kategorii - posortowane, wspólne dla wszystkich graczy"""
+    catalog = get_event_catalog(event_id)
+    key = (model.__name__, category)
+    ids = catalog['question_ids'].get(key)
+    if ids is None:
+        ids = catalog['question_ids'][key] = tuple(sorted(
+            question_id for (question_id,) in db.session.query(model.id).filter(*_deck_filter(model, event_id, category))
+        ))
+    return ids
+
+# --- Generowanie kodów QR ---
+# Wspólne dla panelu admina i superhosta. Kody wielorazowe (biały, żółty) są zawsze
+# po jednym, jednorazowe numerowane od 1 (czerwony1, czerwony2, ...). Tryb 'replace'
+# usuwa wszystkie kody eventu i tworzy je od nowa, 'top_up' tylko dopisuje brakujące
+# numery do podanej liczby. Wiersze wstawiamy jednym INSERT (executemany) - na
+# PostgreSQL psycopg2 składa je w wielowierszowe INSERT ... VALUES.
+# Schemat identyfikatorów (wspólny z generate_qr.py) jest w qr_render.py.
+QR_CODES_MAX_PER_COLOR = int(os.environ.get('QR_CODES_MAX_PER_COLOR', 10000))
+
+def parse_qr_code_counts(counts):
+    """{kolor: liczba} z danych formularza; ValueError przy złej wartości"""
+    if counts is not None and not isinstance(counts, dict):
+        raise ValueError('Nieprawidłowa liczba kodów')
+    parsed = {}
+    for color in ONE_TIME_QR_PREFIXES:
+        try:
+            count = int((counts or {}).get(color) or 0)
+        except (ValueError, TypeError):
+            raise ValueError('Nieprawidłowa liczba kodów')
+        if count < 0 or count > QR_CODES_MAX_PER_COLOR:
+            raise ValueError(f'Liczba kodów musi być w zakresie 0-{QR_CODES_MAX_PER_COLOR}')
+        parsed[color] = count
+    return parsed
+
+def provision_qr_codes(event_id, counts, mode='replace'):
+    """Tworzy kody QR eventu i zwraca podsumowanie (utworzone / usunięte / razem)"""
+    deleted = 0
+    existing = set()
+    if mode == 'replace':
+        discard_pending_player_scans(event_id)
+        deleted = QRCode.query.filter_by(event_id=event_id).delete(synchronize_session=False)
+    else:
+        existing = {identifier for (identifier,) in db.session.query(QRCode.code_identifier).filter_by(event_id=event_id)}
+
+    created = dict.fromkeys(list(REUSABLE_QR_CODES) + list(ONE_TIME_QR_PREFIXES), 0)
+    rows = []
+    for identifier, color in qr_identifiers(counts):
+        if identifier not in existing:
+            rows.append({'code_identifier': identifier, 'color': color, 'event_id': event_id})
+            created[color] += 1
+    if rows:
+        db.session.execute(QRCode.__table__.insert(), rows)
     db.session.commit()
+    invalidate_event_catalog(event_id)
+
+    totals = dict(db.session.query(QRCode.color, db.func.count(QRCode.id)).filter_by(event_id=event_id).group_by(QRCode.color))
+    return {
+        'mode': mode,
+        'created': created,
+        'created_total': len(rows),
+        'deleted': deleted,
+        'totals': {color: totals.get(color, 0) for color in created}
+    }
+
+def generate_qr_codes_response(event_id, data):
+    """Wspólna obsługa POST .../qrcodes/generate (admin i superhost)"""
+    if get_game_state(event_id, 'game_active', 'False') == 'True':
+        return jsonify({'message': 'Nie można zmieniać kodów podczas aktywnej gry.'}), 403
+    mode = data.get('mode', 'replace')
+    if mode not in ('replace', 'top_up'):
+        return jsonify({'message': 'Nieznany tryb generowania kodów'}), 400
+    try:
+        counts = parse_qr_code_counts(data.get('counts'))
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+
+    started = time.perf_counter()
+    summary = provision_qr_codes(event_id, counts, mode)
+    log.info("🔳 Kody QR eventu %s (%s): dodano %d, usunięto %d w %.0f ms", event_id, mode,
+             summary['created_total'], summary['deleted'], (time.perf_counter() - started) * 1000)
+    message = 'Kody QR zostały wygenerowane.' if mode == 'replace' else 'Kody QR zostały uzupełnione.'
+    return jsonify({
+        'message': f"{message} Dodano: {summary['created_total']}, usunięto: {summary['deleted']}.",
+        'summary': summary
+    })
+
+# --- Obrazy kodów QR ---
+# Kody renderowane są na serwerze (bez CDN - działa w sieci bez internetu) i trzymane
+# w cache na dysku pod hashem treści (tekst, format, kolory, wersja renderera) - ten sam
+# kod renderuje się raz, a hash służy też jako ETag. Arkusze do druku (PDF lub ZIP
+# z PNG) renderujemy w procesie serwera, stronami w wątkach systemowych puli gevent -
+# pętla serwera obsługuje w tym czasie inne żądania. Bez puli procesów: potomek 'spawn'
+# importowałby app.py od nowa (monkey patching, baza, SocketIO, zadania w tle).
+QR_CACHE_DIR = os.environ.get('QR_CACHE_DIR', os.path.join(app.instance_path, 'qr_cache'))
+PLAYER_QR_COLOR = '#667eea'
+
+def qr_image_response(data, fmt, fill='#000000'):
+    path, key = cached_qr_image(QR_CACHE_DIR, data, fmt, fill)
+    mimetype = 'image/svg+xml' if fmt == 'svg' else 'image/png'
+    return send_file(path, mimetype=mimetype, etag=key, max_age=86400)
+
+def export_qr_sheets(event_id, fmt='pdf', colors=None, cols=3, rows=4):
+    """Arkusze kodów QR eventu do druku: bajty PDF albo ZIP ze stronami PNG"""
+    query = QRCode.query.filter_by(event_id=event_id)
+    if colors:
+        query = query.filter(QRCode.color.in_(colors))
+    entries = [(url_for('player_view', event_id=event_id, qr_code=qr.code_identifier, _external=True),
+                qr_label(qr.code_identifier))
+               for qr in query.order_by(QRCode.id)]
+    if not entries:
+        return None
+    per_page = cols * rows
+    chunks = [entries[i:i + per_page] for i in range(0, len(entries), per_page)]
+    # Strony renderują się równolegle w wątkach puli gevent (PIL zwalnia GIL przy skalowaniu
+    # i kodowaniu PNG); imap oddaje je po kolei, więc PDF / ZIP dopisuje stronę za stroną
+    pages = get_hub().threadpool.imap(partial(render_sheet_page, QR_CACHE_DIR, cols=cols, rows=rows), chunks)
+    if fmt == 'pdf':
+        return pages_to_pdf(pages)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:  # PNG i tak jest skompresowany
+        for number, page in enumerate(pages, start=1):
+            archive.writestr(f'kody_qr_event{event_id}_strona{number:03d}.png', page)
+    return buffer.getvalue()
+
+# --- Rezerwacje pytań AI ---
+# Na życzenie klienta (prefetch_next) process_ai_answer() dołącza do odpowiedzi następne
+# pytanie z tej samej kategorii - tylko gdy gracz mógłby teraz zeskanować biały kod
+# (cooldown skanowania jest wtedy uzbrajany, jak przy skanie). Pytanie jest rezerwowane
+# na AI_QUESTION_RESERVATION_TTL s: get_ai_question dla tej kategorii wydaje je z pamięci.
+# Rezerwacje giną przy zmianie puli pytań eventu (wersja banku pytań), usunięciu gracza
+# i operacjach hurtowych na graczach (start gry, usunięcie eventu).
+AI_QUESTION_RESERVATION_TTL = float(os.environ.get('AI_QUESTION_RESERVATION_TTL', 120))
+
+_ai_question_reservations = {}  # (event_id, player_id, category_id) -> (payload, wygasa o, wersja banku pytań)
+
+def ai_question_payload(question, category):
+    return {
+        'id': question.id,
+        'text': question.text,
+        'option_a': question.option_a,
+        'option_b': question.option_b,
+        'option_c': question.option_c,
+        'category_id': category.id,
+        'category_name': category.name
+    }
+
+def reserve_next_ai_question(player, category_id):
+    """Następne pytanie AI dla gracza (wydane - z licznikiem wyświetleń) zarezerwowane na TTL; None gdy brak"""
+    category = db.session.get(AICategory, category_id)
+    question = next_deck_question(AIQuestion, player.event_id, player.id, category_id) if category else None
+    if not question:
+        return None
+    bump_question_counters(AIQuestion, question.id, times_shown=1)
+    payload = ai_question_payload(question, category)
+    now = time.monotonic()
+    if len(_ai_question_reservations) > 1000:
+        for key in [key for key, (_, expires, _) in _ai_question_reservations.items() if expires < now]:
+            del _ai_question_reservations[key]
+    event_key = _state_cache_key(player.event_id)
+    _ai_question_reservations[(event_key, player.id, category_id)] = (
+        payload, now + AI_QUESTION_RESERVATION_TTL, _question_bank_version.get(event_key, 0))
+    return payload
+
+def take_ai_question_reservation(player, category_id):
+    event_key = _state_cache_key(player.event_id)
+    reservation = _ai_question_reservations.pop((event_key, player.id, category_id), None)
+    if reservation is None:
+        return None
+    payload, expires, version = reservation
+    if expires < time.monotonic() or version != _question_bank_version.get(event_key, 0):
+        return None
+    return payload
+
+def drop_ai_question_reservations(event_id, player_id=None):
+    """Usuwa rezerwacje eventu (lub jednego gracza) - id graczy w SQLite mogą zostać użyte ponownie"""
+    event_key = _state_cache_key(event_id)
+    for key in [key for key in _ai_question_reservations
+                if key[0] == event_key and (player_id is None or key[1] == player_id)]:
+        del _ai_question_reservations[key]
+
+# --- Cooldown skanowania ---
+# Kody białe i żółte można skanować co SCAN_COOLDOWN_SECONDS (host może to zmienić dla
+# eventu - klucz 'scan_cooldown_seconds' w GameState). Cooldown trzymamy pod kluczem
+# (event, start gry, gracz, kolor) z czasem wygaśnięcia: sprawdzenie i uzbrojenie to
+# jedna operacja w pamięci procesu, a przy skonfigurowanym Redisie SET NX EX wspólny
+# dla wszystkich workerów. Nowy start gry zmienia klucze, więc stare cooldowny same
+# przestają obowiązywać. Wiersze PlayerScan (do analiz) zapisujemy z bufora w tle.
+SCAN_COOLDOWN_SECONDS = int(os.environ.get('SCAN_COOLDOWN_SECONDS', 300))
+SCAN_COOLDOWN_COLORS = ('white', 'yellow')
+SCAN_COOLDOWN_BACKEND = os.environ.get('SCAN_COOLDOWN_BACKEND', 'redis' if SOCKETIO_MESSAGE_QUEUE else 'memory')
+
+_scan_cooldowns = {}       # klucz cooldownu -> wygasa o (time.monotonic())
+_pending_player_scans = []  # wiersze PlayerScan czekające na zapis
+
+def get_scan_cooldown(event_id):
+    """Długość cooldownu skanowania (w sekundach) dla eventu"""
+    try:
+        return max(0, int(get_game_state(event_id, 'scan_cooldown_seconds', SCAN_COOLDOWN_SECONDS)))
+    except (ValueError, TypeError):
+        return SCAN_COOLDOWN_SECONDS
+
+def _scan_cooldown_key(event_id, player_id, color):
+    game_start = get_game_state(event_id, 'game_start_time', '')
+    return f"saper-scan-cooldown:{event_id}:{game_start}:{player_id}:{color}"
+
+def _arm_scan_cooldown_memory(key, seconds):
+    now = time.monotonic()
+    expires = _scan_cooldowns.get(key)
+    if expires is not None and expires > now:
+        return expires - now
+    if len(_scan_cooldowns) > 5000:
+        for stale in [k for k, until in _scan_cooldowns.items() if until <= now]:
+            del _scan_cooldowns[stale]
+    _scan_cooldowns[key] = now + seconds
+    return 0
+
+def _arm_scan_cooldown_redis(key, seconds):
+    client = _get_redis_client()
+    if client.set(key, 1, nx=True, ex=seconds):
+        return 0
+    remaining = client.pttl(key)
+    return remaining / 1000 if remaining and remaining > 0 else 0
+
+def arm_scan_cooldown(event_id, player_id, color):
+    """Sprawdza i uzbraja cooldown; zwraca 0, gdy skan jest dozwolony, inaczej pozostałe sekundy"""
+    seconds = get_scan_cooldown(event_id)
+    if seconds <= 0:
+        return 0
+    key = _scan_cooldown_key(event_id, player_id, color)
+    if SCAN_COOLDOWN_BACKEND == 'redis':
+        try:
+            return _arm_scan_cooldown_redis(key, seconds)
+        except Exception as e:
+            scan_log.warning("⚠️ Cooldown skanowania w Redis niedostępny, używam pamięci: %s", e)
+    return _arm_scan_cooldown_memory(key, seconds)
+
+def claim_qr_code(qr_code_id, player_id):
+    """Przydziela kod jednorazowy graczowi jednym warunkowym UPDATE - True tylko dla zwycięzcy.
+    Przy równoczesnych skanach rowcount = 1 dostaje dokładnie jedna transakcja."""
+    table = QRCode.__table__
+    result = db.session.execute(
+        table.update()
+        .where(table.c.id == qr_code_id, table.c.claimed_by_player_id.is_(None))
+        .values(claimed_by_player_id=player_id)
+    )
+    return result.rowcount == 1
+
+def record_player_scan(player_id, qrcode_id, event_id, color):
+    _pending_player_scans.append({
+        'player_id': player_id,
+        'qrcode_id': qrcode_id,
+        'event_id': event_id,
+        'color_category': color,
+        'scan_time': datetime.utcnow()
+    })
+
+def discard_pending_player_scans(event_id, player_id=None):
+    """Usuwa z bufora skany eventu (lub gracza) - np. gdy ich wiersze nadrzędne są kasowane"""
+    _pending_player_scans[:] = [
+        row for row in _pending_player_scans
+        if row['event_id'] != event_id or (player_id is not None and row['player_id'] != player_id)
+    ]
+
+def flush_player_scans():
+    """Zapisuje bufor skanów jednym INSERT (executemany). Zwraca liczbę zapisanych wierszy."""
+    global _pending_player_scans
+    if not _pending_player_scans:
+        return 0
+    rows, _pending_player_scans = _pending_player_scans, []
+    try:
+        db.session.execute(PlayerScan.__table__.insert(), rows)
+        db.session.commit()
+        return len(rows)
+    except IntegrityError:
+        db.session.rollback()
+    except Exception:
+        db.session.rollback()
+        # Dziennik skanów służy tylko analizom - nie ponawiamy partii, która się nie zapisała
+        raise
+    # Jeden skan gracza / kodu skasowanego po skanie odrzuca całą partię - wtedy zapisujemy
+    # wiersz po wierszu i pomijamy tylko te, które naruszają klucze obce
+    saved = 0
+    for row in rows:
+        try:
+            db.session.execute(PlayerScan.__table__.insert(), row)
+            db.session.commit()
+            saved += 1
+        except IntegrityError:
+            db.session.rollback()
+    if saved < len(rows):
+        db_log.warning("⚠️ Pominięto %d skanów graczy bez powiązanych wierszy", len(rows) - saved)
+    return saved
+
+# --- Zegar gry ---
+# Zegar opisują trzy wartości: pozostały czas gry w chwili kotwicy (timer_remaining),
+# prędkość (time_speed) i znacznik czasu kotwicy (timer_anchor, sekundy epoki - wspólne
+# dla wszystkich procesów). Pozostały czas liczony jest wzorem, więc baza zmienia się
+# tylko przy starcie, pauzie, wznowieniu, zmianie prędkości i korekcie czasu.
+def compute_time_left(state, now=None):
+    """Pozostały czas gry (sekundy) wyliczony ze słownika stanu eventu"""
+    now = time.time() if now is None else now
+    is_running = state.get('is_timer_running') == 'True'
+    try:
+        remaining = state.get('timer_remaining')
+        if remaining is None:
+            # Gra rozpoczęta przed wprowadzeniem kotwicy - stary zapis końca gry
+            if not is_running and state.get('time_left_on_pause') is not None:
+                return max(0.0, float(state['time_left_on_pause']))
+            end_time_str = state.get('game_end_time')
+            if not end_time_str:
+                return 0.0
+            return max(0.0, (datetime.fromisoformat(end_time_str) - datetime.utcnow()).total_seconds())
+        remaining = float(remaining)
+        if is_running:
+            anchor = float(state.get('timer_anchor', now))
+            speed = int(state.get('time_speed', 1))
+            remaining -= max(0.0, now - anchor) * speed
+    except (ValueError, TypeError):
+        return 0.0
+    return max(0.0, remaining)
+
+def timer_anchor(remaining, now=None):
+    """Wartości stanu zakotwiczające zegar na `remaining` sekundach od teraz"""
+    return {
+        'timer_remaining': remaining,
+        'timer_anchor': time.time() if now is None else now
+    }
+
+def compute_time_elapsed(state):
+    """Zwraca (czas netto, czas brutto) gry w sekundach ze słownika stanu eventu"""
+    start_time_str = state.get('game_start_time')
+    if not start_time_str:
+        return 0, 0
+    try:
+        now = datetime.utcnow()
+        time_elapsed_with_pauses = (now - datetime.fromisoformat(start_time_str)).total_seconds()
+        
+        # Odejmij czas pauz dla czasu netto
+        total_paused = float(state.get('total_paused_duration', 0))
+        time_elapsed = time_elapsed_with_pauses - total_paused
+        
+        # Jeśli aktualnie w pauzie, odejmij też czas od rozpoczęcia pauzy
+        if state.get('game_active') == 'True' and state.get('is_timer_running') != 'True':
+            pause_start_str = state.get('pause_start_time')
+            if pause_start_str:
+                current_pause_duration = (now - datetime.fromisoformat(pause_start_str)).total_seconds()
+                time_elapsed -= current_pause_duration
+    except (ValueError, AttributeError):
+        return 0, 0
+    return time_elapsed, time_elapsed_with_pauses
 
 def get_full_game_state(event_id):
     # Pobierz podstawowe dane o stanie gry
-    is_active = get_game_state(event_id, 'game_active', 'False') == 'True'
-    is_timer_running = get_game_state(event_id, 'is_timer_running', 'False') == 'True'
+    state = load_game_state(event_id)
+    is_active = state.get('game_active', 'False') == 'True'
+    is_timer_running = state.get('is_timer_running', 'False') == 'True'
     
     # Oblicz pozostały czas
     time_left = 0
     if is_active:
-        end_time_str = get_game_state(event_id, 'game_end_time')
-        if end_time_str:
-            try:
-                end_time = datetime.fromisoformat(end_time_str)
-                time_left = max(0, (end_time - datetime.utcnow()).total_seconds())
-            except (ValueError, AttributeError):
-                time_left = 0
+        time_left = compute_time_left(state)
     
     # Oblicz czas gry (netto i brutto)
-    time_elapsed = 0
-    time_elapsed_with_pauses = 0
+    time_elapsed, time_elapsed_with_pauses = compute_time_elapsed(state)
+    start_time_str = state.get('game_start_time')
     
-    start_time_str = get_game_state(event_id, 'game_start_time')
-    if start_time_str:
-        try:
-            start_time = datetime.fromisoformat(start_time_str)
-            time_elapsed_with_pauses = (datetime.utcnow() - start_time).total_seconds()
-            
-            # Odejmij czas pauz dla czasu netto
-            total_paused = float(get_game_state(event_id, 'total_paused_duration', 0))
-            time_elapsed = time_elapsed_with_pauses - total_paused
-            
-            # Jeśli aktualnie w pauzie, dodaj czas od rozpoczęcia pauzy
-            if is_active and not is_timer_running:
-                pause_start_str = get_game_state(event_id, 'pause_start_time')
-                if pause_start_str:
-                    pause_start = datetime.fromisoformat(pause_start_str)
-                    current_pause_duration = (datetime.utcnow() - pause_start).total_seconds()
-                    time_elapsed = time_elapsed_with_pauses - total_paused - current_pause_duration
-        except (ValueError, AttributeError):
-            time_elapsed = 0
-            time_elapsed_with_pauses = 0
+    # Liczniki eventu (utrzymywane przyrostowo w EventStats)
+    stats = get_event_stats(event_id)
     
     # Liczba graczy
-    player_count = Player.query.filter_by(event_id=event_id).count()
+    player_count = stats.player_count
     
     # Procent ukończenia
-    total_questions = Question.query.filter_by(event_id=event_id).count()
-    answered_questions = PlayerAnswer.query.filter_by(event_id=event_id).distinct(PlayerAnswer.question_id).count()
+    total_questions = stats.question_count
+    answered_questions = stats.answered_question_count
     completion_percentage = int((answered_questions / total_questions * 100)) if total_questions > 0 else 0
     
     # Liczba poprawnych odpowiedzi
-    correct_answers = PlayerAnswer.query.filter_by(event_id=event_id).count()
+    correct_answers = stats.answer_count
     
     # Status gry
     game_status = 'waiting'
@@ -461,27 +1749,8 @@ def get_full_game_state(event_id):
     bonus_multiplier = int(get_game_state(event_id, 'bonus_multiplier', 1))
     time_speed = int(get_game_state(event_id, 'time_speed', 1))
     
-    # ✅ Generowanie hasła na podstawie indeksów
-    password_value = get_game_state(event_id, 'game_password', 'SAPEREVENT')
-    revealed_indices_str = get_game_state(event_id, 'revealed_password_indices', '')
-    
-    # Parsuj indeksy
-    revealed_indices = set()
-    if revealed_indices_str:
-        try:
-            revealed_indices = set(map(int, revealed_indices_str.split(',')))
-        except (ValueError, AttributeError):
-            revealed_indices = set()
-    
-    # Generuj displayed_password
-    displayed_password = ""
-    for i, char in enumerate(password_value):
-        if char == ' ':
-            displayed_password += '  '
-        elif i in revealed_indices:
-            displayed_password += char
-        else:
-            displayed_password += '_'
+    # ✅ Hasło z odkrytymi literami (widok liczony raz na wersję)
+    displayed_password = password_state(event_id)['display']
     
     return {
         'game_active': is_active,
@@ -497,7 +1766,8 @@ def get_full_game_state(event_id):
         'language_player': language_player,
         'language_host': language_host,
         'bonus_multiplier': bonus_multiplier,
-        'time_speed': time_speed
+        'time_speed': time_speed,
+        'scan_cooldown': get_scan_cooldown(event_id)
     }
 
 def event_to_dict(event):
@@ -536,7 +1806,7 @@ def delete_logo_file(event):
             if os.path.exists(filepath): os.remove(filepath)
             event.logo_url = None
         except Exception as e:
-            print(f"Błąd podczas usuwania pliku logo: {e}")
+            log.error("Błąd podczas usuwania pliku logo: %s", e)
 
 # --- Główne Ścieżki ---
 @app.route('/')
@@ -679,6 +1949,53 @@ def list_qrcodes_public(event_id):
     qrcodes = QRCode.query.filter_by(event_id=event_id).all()
     return render_template('qrcodes.html', qrcodes=qrcodes, event_id=event_id)
 
+@app.route('/qrcodes/<int:event_id>/<code_identifier>.<any(png, svg):fmt>')
+def qrcode_image(event_id, code_identifier, fmt):
+    """Obraz kodu QR eventu (z cache na dysku). Kody wielorazowe są publiczne (ekran gry)."""
+    if not QRCODE_AVAILABLE: return "Renderowanie kodów QR niedostępne (brak pakietu qrcode)", 503
+    qr_entry = catalog_qr_code(event_id, code_identifier)
+    is_admin = session.get('admin_logged_in', False)
+    is_host = session.get('host_event_id') == event_id
+    is_public = qr_entry is not None and qr_entry[1] in REUSABLE_QR_CODES
+    if not (is_admin or is_host or is_public): return "Brak autoryzacji", 401
+    if not qr_entry:
+        return "Nie znaleziono kodu QR", 404
+    return qr_image_response(url_for('player_view', event_id=event_id, qr_code=code_identifier, _external=True), fmt)
+
+@app.route('/qrcodes/<int:event_id>/register.<any(png, svg):fmt>')
+def player_register_qrcode_image(event_id, fmt):
+    """Kod QR do rejestracji graczy"""
+    if not QRCODE_AVAILABLE: return "Renderowanie kodów QR niedostępne (brak pakietu qrcode)", 503
+    if not db.session.get(Event, event_id):
+        return "Nie znaleziono eventu", 404
+    return qr_image_response(url_for('player_register', event_id=event_id, _external=True), fmt, PLAYER_QR_COLOR)
+
+@app.route('/qrcodes/<int:event_id>/player/<int:player_id>.<any(png, svg):fmt>')
+@host_required
+def player_dashboard_qrcode_image(event_id, player_id, fmt):
+    """Kod QR do panelu gracza"""
+    if session.get('host_event_id') != event_id: return "Brak autoryzacji", 401
+    if not QRCODE_AVAILABLE: return "Renderowanie kodów QR niedostępne (brak pakietu qrcode)", 503
+    player = db.session.get(Player, player_id)
+    if not player or player.event_id != event_id:
+        return "Nie znaleziono gracza", 404
+    return qr_image_response(url_for('player_dashboard', event_id=event_id, player_id=player_id, _external=True),
+                             fmt, PLAYER_QR_COLOR)
+
+@app.route('/qrcodes/<int:event_id>/sheets.<any(pdf, zip):fmt>')
+def qrcode_sheets(event_id, fmt):
+    """Arkusze A4 z kodami eventu do druku (?colors=red,green - tylko wybrane kolory)"""
+    is_admin = session.get('admin_logged_in', False)
+    is_host = session.get('host_event_id') == event_id
+    if not (is_admin or is_host): return "Brak autoryzacji", 401
+    if not QRCODE_AVAILABLE: return "Renderowanie kodów QR niedostępne (brak pakietu qrcode)", 503
+    colors = [c for c in request.args.get('colors', '').split(',') if c]
+    content = export_qr_sheets(event_id, 'pdf' if fmt == 'pdf' else 'png', colors)
+    if content is None:
+        return "Brak kodów QR do wydruku", 404
+    return send_file(io.BytesIO(content), as_attachment=True, download_name=f'kody_qr_event{event_id}.{fmt}',
+                     mimetype='application/pdf' if fmt == 'pdf' else 'application/zip')
+
 @app.route('/player_qrcodes/<int:event_id>')
 @host_required
 def player_qrcodes(event_id):
@@ -775,8 +2092,12 @@ def update_or_delete_event(event_id):
     if request.method == 'DELETE':
         if event_id <= 1: return jsonify({'error': 'Nie można usunąć pierwszego eventu.'}), 403
         delete_logo_file(event)
+        discard_pending_player_scans(event_id)
         db.session.delete(event)
         db.session.commit()
+        drop_leaderboard(event_id)
+        invalidate_game_state_cache(event_id)
+        invalidate_question_bank(event_id)
         return jsonify({'message': f'Event {event_id} został pomyślnie usunięty.'})
 
 @app.route('/api/admin/event/<int:event_id>/upload_logo', methods=['POST'])
@@ -816,6 +2137,7 @@ def reset_event(event_id):
         Player.query.filter_by(event_id=event_id).delete()
         Question.query.filter_by(event_id=event_id).delete()
         QRCode.query.filter_by(event_id=event_id).delete()
+        discard_pending_player_scans(event_id)
         PlayerScan.query.filter_by(event_id=event_id).delete()
         PlayerAnswer.query.filter_by(event_id=event_id).delete()
         FunnyPhoto.query.filter_by(event_id=event_id).delete()
@@ -824,7 +2146,12 @@ def reset_event(event_id):
         AIQuestion.query.filter_by(event_id=event_id).delete()
         AIPlayerAnswer.query.filter_by(event_id=event_id).delete()
         AICategory.query.filter_by(event_id=event_id).delete()
+        MinigameProgress.query.filter_by(event_id=event_id).delete()
+        recompute_event_stats(event_id)
         db.session.commit()
+        invalidate_game_state_cache(event_id)
+        invalidate_question_bank(event_id)
+        drop_leaderboard(event_id)
 
         # Reinicjalizuj domyślne kategorie AI
         init_default_ai_categories(event_id)
@@ -842,19 +2169,18 @@ def reset_event(event_id):
 @admin_required
 def admin_generate_qr_codes():
     data = request.json
-    event_id = data.get('event_id')
-    if get_game_state(event_id, 'game_active', 'False') == 'True':
-        return jsonify({'message': 'Nie można zmieniać kodów podczas aktywnej gry.'}), 403
-    QRCode.query.filter_by(event_id=event_id).delete()
-    db.session.add(QRCode(code_identifier='bialy', color='white', event_id=event_id))
-    db.session.add(QRCode(code_identifier='zolty', color='yellow', event_id=event_id))
-    counts = data.get('counts', {})
-    one_time_codes = {'red': 'czerwony', 'white_trap': 'pulapka', 'green': 'zielony', 'pink': 'rozowy'}
-    for color, prefix in one_time_codes.items():
-        for i in range(1, int(counts.get(color, 0)) + 1):
-            db.session.add(QRCode(code_identifier=f"{prefix}{i}", color=color, event_id=event_id))
-    db.session.commit()
-    return jsonify({'message': 'Kody QR zostały wygenerowane.'})
+    return generate_qr_codes_response(data.get('event_id'), data)
+
+@app.route('/api/admin/metrics/timers', methods=['GET'])
+@admin_required
+def get_timer_metrics():
+    """Czas trwania iteracji pętli zegara (update_timers) i czy ten proces jest liderem"""
+    return jsonify({
+        **_tick_metrics,
+        'pid': os.getpid(),
+        'timer_leader': _timer_leader['handle'] is not None,
+        'leader_lock': _timer_leader['kind']
+    })
 
 # --- API: ADMIN AI Questions Management ---
 @app.route('/api/admin/ai/categories/<int:event_id>', methods=['GET'])
@@ -890,8 +2216,7 @@ def get_admin_ai_questions(category_id):
         'option_c': q.option_c,
         'correct_answer': q.correct_answer,
         'source': q.source,
-        'times_shown': q.times_shown,
-        'times_correct': q.times_correct
+        **with_pending_counters(AIQuestion, q)
     } for q in questions])
 
 @app.route('/api/admin/ai/question/<int:question_id>', methods=['PUT', 'DELETE'])
@@ -916,8 +2241,10 @@ def update_or_delete_ai_question(question_id):
         return jsonify({'message': 'Pytanie zaktualizowane'})
 
     if request.method == 'DELETE':
+        event_id = question.event_id
         db.session.delete(question)
         db.session.commit()
+        invalidate_question_bank(event_id)
         return jsonify({'message': 'Pytanie usunięte'})
 
 @app.route('/api/host/qrcodes', methods=['GET'])
@@ -948,66 +2275,65 @@ def get_host_game_state():
 @host_required
 def start_game():
     event_id = session['host_event_id']
-    print(f"=== START GAME DEBUG ===")
-    print(f"Event ID: {event_id}")
+    game_log.debug("Start gry: event_id=%s", event_id)
     
     try:
         # ✅ KROK 1: Najpierw resetujemy kody QR (usuwamy referencje do graczy)
-        qr_codes_to_reset = QRCode.query.filter(
-            QRCode.event_id == event_id, 
+        # UPDATE wykonuje się przed DELETE w tej samej transakcji, więc osobny commit nie jest potrzebny
+        QRCode.query.filter(
+            QRCode.event_id == event_id,
             QRCode.claimed_by_player_id.isnot(None)
-        ).all()
-        for qr in qr_codes_to_reset:
-            qr.claimed_by_player_id = None
-        
-        # Commit żeby zapisać zmiany w kodach QR przed usunięciem graczy
-        db.session.commit()
+        ).update({QRCode.claimed_by_player_id: None}, synchronize_session=False)
         
         # ✅ KROK 2: Teraz możemy bezpiecznie usunąć graczy i powiązane dane
         Player.query.filter_by(event_id=event_id).delete()
+        discard_pending_player_scans(event_id)
         PlayerScan.query.filter_by(event_id=event_id).delete()
         PlayerAnswer.query.filter_by(event_id=event_id).delete()
         FunnyPhoto.query.filter_by(event_id=event_id).delete()
         PhotoVote.query.filter_by(event_id=event_id).delete()
-        
-        set_game_state(event_id, 'game_active', 'True')
-        set_game_state(event_id, 'is_timer_running', 'True')
-        set_game_state(event_id, 'game_start_time', datetime.utcnow().isoformat())
-        set_game_state(event_id, 'total_paused_duration', 0)
-        set_game_state(event_id, 'bonus_multiplier', 1)
-        set_game_state(event_id, 'time_speed', 1)
+        legacy_minigame_keys = clear_minigame_progress(event_id)
+        recompute_event_stats(event_id)
         
         minutes = int(request.json.get('minutes', 30))
         duration_seconds = minutes * 60
-        set_game_state(event_id, 'initial_game_duration', duration_seconds)
-        end_time = datetime.utcnow() + timedelta(seconds=duration_seconds)
-        set_game_state(event_id, 'game_end_time', end_time.isoformat())
         
-        print(f"Game state set: active=True, timer_running=True, duration={minutes}min")
+        # ✅ KROK 3: Cały stan startowy jednym upsertem - jeden commit dla całego startu gry
+        update_game_state(event_id, {
+            'game_active': 'True',
+            'is_timer_running': 'True',
+            'game_start_time': datetime.utcnow().isoformat(),
+            'total_paused_duration': 0,
+            'bonus_multiplier': 1,
+            'time_speed': 1,
+            'initial_game_duration': duration_seconds,
+            **timer_anchor(duration_seconds)
+        })
+        if legacy_minigame_keys:
+            invalidate_game_state_cache(event_id)
         
-        db.session.commit()
+        game_log.info("Game state set: active=True, timer_running=True, duration=%smin (event %s)", minutes, event_id)
         
         # ✅ POPRAWKA: Pobierz świeży stan i emituj SYNCHRONICZNIE
         room = f'event_{event_id}'
-        print(f"Emitting to room: {room}")
         
         # Pobierz aktualny stan po zapisie do bazy
         fresh_state = get_full_game_state(event_id)
-        print(f"Fresh state to emit: time_left={fresh_state.get('time_left')}, game_active={fresh_state.get('game_active')}")
+        game_log.debug("Fresh state to emit: time_left=%s, game_active=%s", fresh_state.get('time_left'), fresh_state.get('game_active'))
         
         # Wyemituj aktualizację stanu
         socketio.emit('game_state_update', fresh_state, room=room)
-        socketio.emit('leaderboard_update', [], room=room)
+        emit_timer_state(event_id)
+        drop_leaderboard(event_id)
+        emit_leaderboard_update(room)
         socketio.emit('password_update', fresh_state['password'], room=room)
         socketio.emit('photos_update', [], room=room)  # Resetuj galerię
         
-        print(f"✅ Game started successfully! Updates emitted.")
+        game_log.info("✅ Game started successfully! Updates emitted to %s.", room)
         
         return jsonify({'message': f'Gra rozpoczęta na {minutes} minut.'})
     except Exception as e:
-        print(f"❌ ERROR in start_game: {e}")
-        import traceback
-        traceback.print_exc()
+        game_log.exception("❌ ERROR in start_game: %s", e)
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
@@ -1025,8 +2351,7 @@ def stop_game():
     if not event.check_password(password):
         return jsonify({'error': 'Nieprawidłowe hasło!'}), 401
 
-    set_game_state(event_id, 'game_active', 'False')
-    set_game_state(event_id, 'is_timer_running', 'False')
+    update_game_state(event_id, {'game_active': 'False', 'is_timer_running': 'False'})
     emit_full_state_update(f'event_{event_id}')
     return jsonify({'message': 'Gra została zatrzymana.'})
 
@@ -1043,54 +2368,66 @@ def game_control():
 
     if control == 'pause':
         if is_running:
-            # ✅ PAUZOWANIE - zapisz dokładnie tyle czasu ile pokazuje zegar
-            set_game_state(event_id, 'is_timer_running', 'False')
-            set_game_state(event_id, 'pause_start_time', datetime.utcnow().isoformat())
-            end_time_str = get_game_state(event_id, 'game_end_time')
-            if end_time_str:
-                # Zapisz dokładnie ile sekund pozostało do końca
-                time_left = (datetime.fromisoformat(end_time_str) - datetime.utcnow()).total_seconds()
-                set_game_state(event_id, 'time_left_on_pause', time_left)
-                print(f"⏸️  Paused at: {time_left:.1f}s")
+            # ✅ PAUZOWANIE - zakotwicz zegar dokładnie na tym, co pokazuje
+            time_left = compute_time_left(load_game_state(event_id))
+            update_game_state(event_id, {
+                'is_timer_running': 'False',
+                'pause_start_time': datetime.utcnow().isoformat(),
+                **timer_anchor(time_left)
+            })
+            game_log.info("⏸️  Paused at: %.1fs", time_left)
         else:
             # ✅ WZNOWIENIE - wznów dokładnie z tego samego momentu
+            changes = {}
             pause_start_str = get_game_state(event_id, 'pause_start_time')
             if pause_start_str:
                 paused_duration = (datetime.utcnow() - datetime.fromisoformat(pause_start_str)).total_seconds()
                 total_paused = float(get_game_state(event_id, 'total_paused_duration', 0))
-                set_game_state(event_id, 'total_paused_duration', total_paused + paused_duration)
+                changes['total_paused_duration'] = total_paused + paused_duration
             
             # Pobierz dokładnie tyle czasu ile było podczas pauzy
-            time_left = float(get_game_state(event_id, 'time_left_on_pause', 0))
+            time_left = compute_time_left(load_game_state(event_id))
             
-            # ✅ Wznów z dokładnie tego samego miejsca (bez przeliczania!)
-            # update_timers() zastosuje aktualną prędkość automatycznie
-            new_end_time = datetime.utcnow() + timedelta(seconds=time_left)
-            set_game_state(event_id, 'game_end_time', new_end_time.isoformat())
-            set_game_state(event_id, 'is_timer_running', 'True')
+            # ✅ Wznów z dokładnie tego samego miejsca - nowa kotwica od teraz
+            changes.update(timer_anchor(time_left))
+            changes['is_timer_running'] = 'True'
+            update_game_state(event_id, changes)
             
             current_speed = int(get_game_state(event_id, 'time_speed', 1))
-            print(f"▶️  Resumed at: {time_left:.1f}s (speed x{current_speed})")
+            game_log.info("▶️  Resumed at: %.1fs (speed x%s)", time_left, current_speed)
     
     elif control == 'speed':
         current_speed = int(get_game_state(event_id, 'time_speed', 1))
         new_speed = int(value) if str(current_speed) != str(value) else 1
         
-        print(f"⚡ Speed change: {current_speed}x → {new_speed}x")
+        game_log.info("⚡ Speed change: %sx → %sx", current_speed, new_speed)
         
-        # ✅ TYLKO zmień prędkość
-        # NIE modyfikuj time_left_on_pause - to zatrzymany czas!
-        set_game_state(event_id, 'time_speed', new_speed)
+        # ✅ Gdy zegar biegnie, przekotwicz go: czas do tej chwili liczony jest jeszcze
+        # starą prędkością. W pauzie pozostały czas stoi - zmienia się tylko prędkość.
+        changes = {'time_speed': new_speed}
+        if is_active and is_running:
+            changes.update(timer_anchor(compute_time_left(load_game_state(event_id))))
+        update_game_state(event_id, changes)
         
         if is_active and is_running:
-            print(f"   Running - update_timers() will apply x{new_speed}")
+            game_log.debug("   Running - clock re-anchored at x%s", new_speed)
         elif is_active and not is_running:
-            print(f"   Paused - x{new_speed} will be used after resume")        
+            game_log.debug("   Paused - x%s will be used after resume", new_speed)
     elif control == 'language_player':
         set_game_state(event_id, 'language_player', value)
 
     elif control == 'language_host':
         set_game_state(event_id, 'language_host', value)
+
+    elif control == 'scan_cooldown':
+        # Odstęp (w sekundach) między skanami kodów białych/żółtych jednego gracza
+        try:
+            seconds = int(value)
+        except (ValueError, TypeError):
+            return jsonify({'error': 'Nieprawidłowa wartość cooldownu'}), 400
+        if seconds < 0 or seconds > 3600:
+            return jsonify({'error': 'Cooldown musi być w zakresie 0-3600 s'}), 400
+        set_game_state(event_id, 'scan_cooldown_seconds', seconds)
     
     emit_full_state_update(f'event_{event_id}')
     return jsonify(get_full_game_state(event_id))
@@ -1127,30 +2464,24 @@ def adjust_time():
         # Oblicz nowy end_time
         new_duration_seconds = int(new_minutes) * 60
         
+        # ✅ Nowa kotwica: tyle czasu zostaje od teraz (w pauzie - od wznowienia)
+        # Aktualizuj initial_game_duration (dla statystyk)
+        update_game_state(event_id, {
+            'initial_game_duration': new_duration_seconds,
+            **timer_anchor(new_duration_seconds)
+        })
+        
         if is_running:
-            # ✅ Jeśli gra jest uruchomiona, ustaw nowy end_time od teraz
-            new_end_time = datetime.utcnow() + timedelta(seconds=new_duration_seconds)
-            set_game_state(event_id, 'game_end_time', new_end_time.isoformat())
-            print(f"⏰ Adjusted time while running: {new_minutes} min (new end: {new_end_time})")
+            game_log.info("⏰ Adjusted time while running: %s min", new_minutes)
         else:
-            # ✅ Jeśli gra jest zapauzowana, ustaw time_left_on_pause
-            set_game_state(event_id, 'time_left_on_pause', new_duration_seconds)
-            # Ustaw również game_end_time na przyszłość (będzie zaktualizowany przy wznowieniu)
-            new_end_time = datetime.utcnow() + timedelta(seconds=new_duration_seconds)
-            set_game_state(event_id, 'game_end_time', new_end_time.isoformat())
-            print(f"⏸️  Adjusted time while paused: {new_minutes} min (time_left_on_pause: {new_duration_seconds}s)")
-        
-        # Aktualizuj initial_game_duration (dla statystyk)
-        set_game_state(event_id, 'initial_game_duration', new_duration_seconds)
+            game_log.info("⏸️  Adjusted time while paused: %s min", new_minutes)
         
         # Wyemituj aktualizację stanu
         emit_full_state_update(f'event_{event_id}')
         
         return jsonify({'message': f'Czas gry został zmieniony na {new_minutes} minut.'})
     except Exception as e:
-        print(f"❌ ERROR in adjust_time: {e}")
-        import traceback
-        traceback.print_exc()
+        game_log.exception("❌ ERROR in adjust_time: %s", e)
         return jsonify({'error': str(e)}), 500
 
 # ✅ NOWY ENDPOINT: Wysyłanie komunikatów na ekran gry
@@ -1178,41 +2509,15 @@ def send_message():
     return jsonify({'message': 'Komunikat wysłany na ekran gry'})
 
 @app.route('/fix-db-columns-v2')
+@admin_required
 def fix_db_columns_v2():
+    """Zgodność wsteczna - uruchamia wersjonowane migracje (zob. flask migrate-db)"""
     try:
-        # Najpierw sprawdź, które kolumny już istnieją
-        result = db.session.execute("""
-            SELECT column_name 
-            FROM information_schema.columns 
-            WHERE table_name = 'question'
-        """)
-        existing_columns = [row[0] for row in result]
-        
-        added = []
-        
-        # Dodaj brakujące kolumny
-        if 'category' not in existing_columns:
-            db.session.execute("ALTER TABLE question ADD COLUMN category VARCHAR(50) DEFAULT 'company'")
-            added.append('category')
-            
-        if 'difficulty' not in existing_columns:
-            db.session.execute("ALTER TABLE question ADD COLUMN difficulty VARCHAR(20) DEFAULT 'easy'")
-            added.append('difficulty')
-            
-        if 'times_shown' not in existing_columns:
-            db.session.execute("ALTER TABLE question ADD COLUMN times_shown INTEGER DEFAULT 0")
-            added.append('times_shown')
-            
-        if 'times_correct' not in existing_columns:
-            db.session.execute("ALTER TABLE question ADD COLUMN times_correct INTEGER DEFAULT 0")
-            added.append('times_correct')
-        
-        db.session.commit()
-        
-        if added:
-            return f"Dodano kolumny: {', '.join(added)}<br><br>Możesz teraz dodawać pytania!"
+        applied = run_migrations()
+        if applied:
+            return f"Zastosowano migracje: {', '.join(applied)}<br><br>Możesz teraz dodawać pytania!"
         else:
-            return "Wszystkie kolumny już istnieją. Możesz dodawać pytania!"
+            return "Schemat bazy jest aktualny. Możesz dodawać pytania!"
             
     except Exception as e:
         db.session.rollback()
@@ -1240,9 +2545,12 @@ def warn_player(player_id):
 def delete_player(player_id):
     player = db.session.get(Player, player_id)
     if player and player.event_id == session['host_event_id']:
+        event_id = player.event_id
+        discard_pending_player_scans(event_id, player_id)
         db.session.delete(player)
+        recompute_event_stats(event_id)
         db.session.commit()
-        emit_leaderboard_update(f'event_{session["host_event_id"]}')
+        player_removed(event_id, player_id)
         return jsonify({'message': 'Gracz usunięty'})
     return jsonify({'error': 'Nie znaleziono gracza'}), 404
 
@@ -1251,64 +2559,25 @@ def delete_player(player_id):
 @host_required
 def get_minigames_status():
     event_id = session['host_event_id']
-    tetris_disabled = get_game_state(event_id, 'minigame_tetris_disabled', 'False') == 'True'
-    arkanoid_disabled = get_game_state(event_id, 'minigame_arkanoid_disabled', 'False') == 'True'
-    snake_disabled = get_game_state(event_id, 'minigame_snake_disabled', 'False') == 'True'
-    pacman_disabled = get_game_state(event_id, 'minigame_pacman_disabled', 'False') == 'True'
-    trex_disabled = get_game_state(event_id, 'minigame_trex_disabled', 'False') == 'True'
-    return jsonify({
-        'tetris_enabled': not tetris_disabled,
-        'arkanoid_enabled': not arkanoid_disabled,
-        'snake_enabled': not snake_disabled,
-        'pacman_enabled': not pacman_disabled,
-        'trex_enabled': not trex_disabled
-    })
+    return jsonify({f'{name}_enabled': enabled for name, enabled in minigames_enabled(event_id).items()})
 
 @app.route('/api/host/minigames/toggle', methods=['POST'])
 @host_required
 def toggle_minigame():
     event_id = session['host_event_id']
     data = request.json
-    game_type = data.get('game_type')
+    game = MINIGAMES_BY_NAME.get(data.get('game_type'))
     enabled = data.get('enabled', False)
-    
-    if game_type == 'tetris':
-        # Zapisujemy czy gra jest WYŁĄCZONA (odwrotna logika - domyślnie włączona)
-        set_game_state(event_id, 'minigame_tetris_disabled', 'False' if enabled else 'True')
-        return jsonify({
-            'message': f'Tetris {"aktywowany" if enabled else "deaktywowany"}',
-            'tetris_enabled': enabled
-        })
-    elif game_type == 'arkanoid':
-        # Zapisujemy czy gra jest WYŁĄCZONA (odwrotna logika - domyślnie włączona)
-        set_game_state(event_id, 'minigame_arkanoid_disabled', 'False' if enabled else 'True')
-        return jsonify({
-            'message': f'Arkanoid {"aktywowany" if enabled else "deaktywowany"}',
-            'arkanoid_enabled': enabled
-        })
-    elif game_type == 'snake':
-        # Zapisujemy czy gra jest WYŁĄCZONA (odwrotna logika - domyślnie włączona)
-        set_game_state(event_id, 'minigame_snake_disabled', 'False' if enabled else 'True')
-        return jsonify({
-            'message': f'Snake {"aktywowany" if enabled else "deaktywowany"}',
-            'snake_enabled': enabled
-        })
-    elif game_type == 'pacman':
-        # Zapisujemy czy gra jest WYŁĄCZONA (odwrotna logika - domyślnie włączona)
-        set_game_state(event_id, 'minigame_pacman_disabled', 'False' if enabled else 'True')
-        return jsonify({
-            'message': f'PacMan {"aktywowany" if enabled else "deaktywowany"}',
-            'pacman_enabled': enabled
-        })
-    elif game_type == 'trex':
-        # Zapisujemy czy gra jest WYŁĄCZONA (odwrotna logika - domyślnie włączona)
-        set_game_state(event_id, 'minigame_trex_disabled', 'False' if enabled else 'True')
-        return jsonify({
-            'message': f'T-Rex {"aktywowany" if enabled else "deaktywowany"}',
-            'trex_enabled': enabled
-        })
 
-    return jsonify({'error': 'Nieznany typ minigry'}), 400
+    if not game:
+        return jsonify({'error': 'Nieznany typ minigry'}), 400
+
+    # Zapisujemy czy gra jest WYŁĄCZONA (odwrotna logika - domyślnie włączona)
+    set_game_state(event_id, game.disabled_key, 'False' if enabled else 'True')
+    return jsonify({
+        'message': f'{game.label} {"aktywowany" if enabled else "deaktywowany"}',
+        f'{game.name}_enabled': enabled
+    })
 
 @app.route('/api/host/questions', methods=['GET', 'POST'])
 @host_required
@@ -1328,7 +2597,9 @@ def host_questions():
             event_id=event_id
         )
         db.session.add(new_q)
+        bump_event_stats(event_id, question_count=1)
         db.session.commit()
+        invalidate_question_bank(event_id)
         return jsonify({'id': new_q.id})
     
     questions = Question.query.filter_by(event_id=event_id).all()
@@ -1340,8 +2611,7 @@ def host_questions():
         'letterToReveal': q.letter_to_reveal, 
         'category': q.category,
         'difficulty': q.difficulty,
-        'times_shown': q.times_shown,
-        'times_correct': q.times_correct
+        **with_pending_counters(Question, q)
     } for q in questions])
 
 @app.route('/api/host/question/<int:question_id>', methods=['PUT', 'DELETE'])
@@ -1359,14 +2629,21 @@ def manage_question(question_id):
         q.option_c = data['answers'][2]
         q.correct_answer = data.get('correctAnswer', q.correct_answer)
         q.letter_to_reveal = data.get('letterToReveal', q.letter_to_reveal).upper()
+        previous_category = q.category
         q.category = data.get('category', q.category)
         q.difficulty = data.get('difficulty', q.difficulty)
         db.session.commit()
+        # Zmiana kategorii przenosi pytanie między taliami - listy id w katalogu do przeliczenia
+        if q.category != previous_category:
+            invalidate_question_bank(q.event_id)
         return jsonify({'message': 'Pytanie zaktualizowane'})
     
     if request.method == 'DELETE':
+        event_id = q.event_id
         db.session.delete(q)
+        recompute_event_stats(event_id)
         db.session.commit()
+        invalidate_question_bank(event_id)
         return jsonify({'message': 'Pytanie usunięte'})
 
 @app.route('/api/host/qrcodes/counts', methods=['GET'])
@@ -1424,6 +2701,7 @@ def manage_ai_categories():
         )
         db.session.add(new_category)
         db.session.commit()
+        invalidate_event_catalog(event_id)
 
         return jsonify({
             'id': new_category.id,
@@ -1447,6 +2725,7 @@ def update_or_delete_ai_category(category_id):
         category.is_enabled = data.get('is_enabled', category.is_enabled)
         category.difficulty_level = data.get('difficulty_level', category.difficulty_level)
         db.session.commit()
+        invalidate_event_catalog(event_id)
 
         return jsonify({
             'id': category.id,
@@ -1463,6 +2742,7 @@ def update_or_delete_ai_category(category_id):
         AIQuestion.query.filter_by(category_id=category_id).delete()
         db.session.delete(category)
         db.session.commit()
+        invalidate_question_bank(event_id)
 
         return jsonify({'message': 'Kategoria została usunięta'})
 
@@ -1509,6 +2789,7 @@ def generate_questions_for_category(category_id):
         generated_count += 1
 
     db.session.commit()
+    invalidate_question_bank(event_id)
 
     return jsonify({
         'message': f'Wygenerowano {generated_count} pytań dla kategorii {category.name}',
@@ -1524,22 +2805,7 @@ def host_generate_qr_codes():
     if not event or not event.is_superhost:
         return jsonify({'error': 'Brak uprawnień Superhost'}), 403
     
-    if get_game_state(event_id, 'game_active', 'False') == 'True':
-        return jsonify({'message': 'Nie można zmieniać kodów podczas aktywnej gry.'}), 403
-    
-    data = request.json
-    QRCode.query.filter_by(event_id=event_id).delete()
-    db.session.add(QRCode(code_identifier='bialy', color='white', event_id=event_id))
-    db.session.add(QRCode(code_identifier='zolty', color='yellow', event_id=event_id))
-    
-    counts = data.get('counts', {})
-    one_time_codes = {'red': 'czerwony', 'white_trap': 'pulapka', 'green': 'zielony', 'pink': 'rozowy'}
-    for color, prefix in one_time_codes.items():
-        for i in range(1, int(counts.get(color, 0)) + 1):
-            db.session.add(QRCode(code_identifier=f"{prefix}{i}", color=color, event_id=event_id))
-    
-    db.session.commit()
-    return jsonify({'message': 'Kody QR zostały wygenerowane.'})
+    return generate_qr_codes_response(event_id, request.json)
 
 # --- API: PLAYER ---
 @app.route('/api/player/register', methods=['POST'])
@@ -1550,8 +2816,9 @@ def register_player():
         return jsonify({'error': 'Ta nazwa jest już zajęta.'}), 409
     new_player = Player(name=name, event_id=event_id)
     db.session.add(new_player)
+    bump_event_stats(event_id, player_count=1)
     db.session.commit()
-    emit_leaderboard_update(f'event_{event_id}')
+    player_score_changed(new_player)
     return jsonify({'id': new_player.id, 'name': new_player.name, 'score': 0})
 
 @app.route('/api/player/scan_qr', methods=['POST'])
@@ -1559,21 +2826,14 @@ def scan_qr():
     data = request.json
     player_id, qr_id, event_id = data.get('player_id'), data.get('qr_code'), data.get('event_id')
     
-    # DEBUG LOGGING
-    print(f"=== SCAN QR DEBUG ===")
-    print(f"Received data: {data}")
-    print(f"Player ID: {player_id}, QR Code: {qr_id}, Event ID: {event_id}")
+    scan_log.debug("Skan QR: player_id=%s, qr_code=%s, event_id=%s", player_id, qr_id, event_id)
     
     # ✅ WALIDACJA: Sprawdź czy gracz istnieje
     player = db.session.get(Player, player_id) if player_id else None
     
-    print(f"Player found: {player is not None}")
-    if player:
-        print(f"Player name: {player.name}, Event ID: {player.event_id}")
-    
     # ✅ Jeśli gracz nie istnieje, zwróć błąd z flagą czyszczenia
     if not player:
-        print(f"ERROR: Player ID {player_id} not found in database!")
+        scan_log.info("Player ID %s not found in database", player_id)
         return jsonify({
             'status': 'error',
             'message': 'Twoje dane wygasły po resecie gry. Odśwież stronę (F5) i zarejestruj się ponownie.',
@@ -1582,70 +2842,52 @@ def scan_qr():
     
     # ✅ Sprawdź czy event_id gracza zgadza się z event_id w żądaniu
     if player.event_id != event_id:
-        print(f"ERROR: Player event mismatch. Player event: {player.event_id}, Request event: {event_id}")
+        scan_log.info("Player event mismatch. Player event: %s, Request event: %s", player.event_id, event_id)
         return jsonify({
             'status': 'error',
             'message': 'Nieprawidłowy event. Odśwież stronę.',
             'clear_storage': True
         }), 400
     
-    # Znajdź kod QR
-    qr_code = QRCode.query.filter_by(code_identifier=qr_id, event_id=event_id).first()
+    # Znajdź kod QR (katalog eventu w pamięci)
+    qr_entry = catalog_qr_code(event_id, qr_id)
     
-    print(f"QR Code found: {qr_code is not None}")
-    if qr_code:
-        print(f"QR Code color: {qr_code.color}")
-    
-    if not qr_code:
-        print(f"ERROR: QR code not found!")
+    if not qr_entry:
+        scan_log.info("QR code %s not found in event %s", qr_id, event_id)
         return jsonify({'message': 'Nieprawidłowy kod QR.'}), 404
+    qr_code_id, qr_color = qr_entry
     
     # Sprawdź czy gra jest aktywna
     game_active = get_game_state(event_id, 'game_active', 'False')
-    print(f"Game active: {game_active}")
     
     if game_active != 'True':
-        print(f"ERROR: Game not active!")
+        scan_log.debug("Game not active in event %s", event_id)
         return jsonify({'message': 'Gra nie jest aktywna.'}), 403
 
-    print(f"QR Code color check: {qr_code.color}")
+    scan_log.debug("QR code %s: color %s", qr_id, qr_color)
 
     # BIAŁE I ŻÓŁTE KODY (wielorazowe - quizy)
-    if qr_code.color in ['white', 'yellow']:
-        last_scan = PlayerScan.query.filter_by(
-            player_id=player_id,
-            color_category=qr_code.color
-        ).order_by(PlayerScan.scan_time.desc()).first()
-
-        if last_scan and datetime.utcnow() < last_scan.scan_time + timedelta(minutes=5):
-            wait_time = (last_scan.scan_time + timedelta(minutes=5) - datetime.utcnow()).seconds
+    if qr_color in SCAN_COOLDOWN_COLORS:
+        remaining = arm_scan_cooldown(event_id, player_id, qr_color)
+        if remaining > 0:
+            wait_time = math.ceil(remaining)
             return jsonify({
                 'status': 'wait',
                 'message': f'Odczekaj jeszcze {wait_time // 60}m {wait_time % 60}s.'
             }), 429
 
-        db.session.add(PlayerScan(
-            player_id=player_id,
-            qrcode_id=qr_code.id,
-            event_id=event_id,
-            color_category=qr_code.color
-        ))
-        db.session.commit()
+        record_player_scan(player_id, qr_code_id, event_id, qr_color)
 
         # BIAŁY KOD - wybór między pytaniami ręcznymi i AI
-        if qr_code.color == 'white':
+        if qr_color == 'white':
             # Sprawdź czy są dostępne pytania AI
-            active_ai_categories = AICategory.query.filter_by(event_id=event_id, is_enabled=True).all()
+            active_ai_categories = catalog_ai_categories(event_id)
 
             # Jeśli są aktywne kategorie AI, pokaż wybór kategorii
             if active_ai_categories:
                 return jsonify({
                     'status': 'ai_categories',
-                    'categories': [{
-                        'id': cat.id,
-                        'name': cat.name,
-                        'difficulty_level': cat.difficulty_level
-                    } for cat in active_ai_categories]
+                    'categories': active_ai_categories
                 })
             # Jeśli nie ma kategorii AI, pokaż pytania ręczne
             quiz_category = 'company'
@@ -1654,12 +2896,7 @@ def scan_qr():
             quiz_category = 'world'
 
         # Pokaż pytania ręczne (dla żółtego lub białego bez kategorii AI)
-        answered_ids = [ans.question_id for ans in PlayerAnswer.query.filter_by(player_id=player_id).all()]
-        question = Question.query.filter(
-            Question.id.notin_(answered_ids),
-            Question.event_id == event_id,
-            Question.category == quiz_category
-        ).order_by(db.func.random()).first()
+        question = next_deck_question(Question, event_id, player.id, quiz_category)
 
         if not question:
             return jsonify({
@@ -1678,141 +2915,47 @@ def scan_qr():
             }
         })
     
-    # 🎮 ZIELONY KOD - MINIGRY (Tetris lub Arkanoid)
-    elif qr_code.color == 'green':
-        print(f"=== GREEN CODE - MINIGAME MODE ===")
-        
-        # Sprawdź czy minigry są aktywne
-        tetris_disabled = get_game_state(event_id, 'minigame_tetris_disabled', 'False')
-        arkanoid_disabled = get_game_state(event_id, 'minigame_arkanoid_disabled', 'False')
-        snake_disabled = get_game_state(event_id, 'minigame_snake_disabled', 'False')
-        pacman_disabled = get_game_state(event_id, 'minigame_pacman_disabled', 'False')
-        trex_disabled = get_game_state(event_id, 'minigame_trex_disabled', 'False')
-
-        print(f"Tetris disabled: {tetris_disabled}, Arkanoid disabled: {arkanoid_disabled}, Snake disabled: {snake_disabled}, PacMan disabled: {pacman_disabled}, T-Rex disabled: {trex_disabled}")
-
-        # Jeśli wszystkie minigry są wyłączone
-        if tetris_disabled == 'True' and arkanoid_disabled == 'True' and snake_disabled == 'True' and pacman_disabled == 'True' and trex_disabled == 'True':
-            message = 'Wszystkie minigry zostały wyłączone przez organizatora.'
-            print(f"All minigames DISABLED - returning error")
-            return jsonify({'status': 'info', 'message': message})
-
-        # Sprawdź postęp gracza we wszystkich grach
-        tetris_score_key = f'minigame_tetris_score_{player_id}'
-        arkanoid_score_key = f'minigame_arkanoid_score_{player_id}'
-        snake_score_key = f'minigame_snake_score_{player_id}'
-        pacman_score_key = f'minigame_pacman_score_{player_id}'
-        trex_score_key = f'minigame_trex_score_{player_id}'
-
-        current_tetris_score = int(get_game_state(event_id, tetris_score_key, '0'))
-        current_arkanoid_score = int(get_game_state(event_id, arkanoid_score_key, '0'))
-        current_snake_score = int(get_game_state(event_id, snake_score_key, '0'))
-        current_pacman_score = int(get_game_state(event_id, pacman_score_key, '0'))
-        current_trex_score = int(get_game_state(event_id, trex_score_key, '0'))
-
-        print(f"Player {player_id} - Tetris: {current_tetris_score}/20, Arkanoid: {current_arkanoid_score}/20, Snake: {current_snake_score}/20, PacMan: {current_pacman_score}/20, T-Rex: {current_trex_score}/20")
-
-        # Sprawdź czy gracz ukończył wszystkie gry
-        tetris_completed = current_tetris_score >= 20
-        arkanoid_completed = current_arkanoid_score >= 20
-        snake_completed = current_snake_score >= 20
-        pacman_completed = current_pacman_score >= 20
-        trex_completed = current_trex_score >= 20
-
-        # Jeśli ukończył wszystkie, nie może grać więcej
-        if tetris_completed and arkanoid_completed and snake_completed and pacman_completed and trex_completed:
-            message = 'Ukończyłeś już wszystkie minigry! Świetna robota!'
-            return jsonify({'status': 'info', 'message': message})
-
-        # Wybierz dostępną minigrę
-        available_games = []
+    # 🎮 ZIELONY KOD - MINIGRY (losowa z dostępnych w rejestrze)
+    elif qr_color == 'green':
+        available_games, message = resolve_minigame_eligibility(event_id, player_id)
+        scan_log.debug("Player %s - available minigames: %s", player_id, [(game.name, score) for game, score in available_games])
 
-        if tetris_disabled != 'True' and not tetris_completed:
-            available_games.append('tetris')
-
-        if arkanoid_disabled != 'True' and not arkanoid_completed:
-            available_games.append('arkanoid')
-
-        if snake_disabled != 'True' and not snake_completed:
-            available_games.append('snake')
-
-        if pacman_disabled != 'True' and not pacman_completed:
-            available_games.append('pacman')
-
-        if trex_disabled != 'True' and not trex_completed:
-            available_games.append('trex')
-        
-        # Jeśli nie ma dostępnych gier
         if not available_games:
-            message = 'Brak dostępnych minigier do ukończenia.'
             return jsonify({'status': 'info', 'message': message})
-        
-        # Wybierz grę (losowo jeśli są dostępne, lub tę jedną dostępną)
-        selected_game = random.choice(available_games)
 
-        if selected_game == 'tetris':
-            print(f"🎮 Starting Tetris for player {player_id}")
-            return jsonify({
-                'status': 'minigame',
-                'game': 'tetris',
-                'current_score': current_tetris_score,
-                'message': f'🎮 Minigra Tetris! Twój postęp: {current_tetris_score}/20 pkt'
-            })
-        elif selected_game == 'arkanoid':
-            print(f"🏓 Starting Arkanoid for player {player_id}")
-            return jsonify({
-                'status': 'minigame',
-                'game': 'arkanoid',
-                'current_score': current_arkanoid_score,
-                'message': f'🏓 Minigra Arkanoid! Twój postęp: {current_arkanoid_score}/20 pkt'
-            })
-        elif selected_game == 'snake':
-            print(f"🐍 Starting Snake for player {player_id}")
-            return jsonify({
-                'status': 'minigame',
-                'game': 'snake',
-                'current_score': current_snake_score,
-                'message': f'🐍 Minigra Snake! Twój postęp: {current_snake_score}/20 pkt'
-            })
-        elif selected_game == 'pacman':
-            print(f"👻 Starting PacMan for player {player_id}")
-            return jsonify({
-                'status': 'minigame',
-                'game': 'pacman',
-                'current_score': current_pacman_score,
-                'message': f'👻 Minigra PacMan! Twój postęp: {current_pacman_score}/20 pkt'
-            })
-        else:  # trex
-            print(f"🦖 Starting T-Rex for player {player_id}")
-            return jsonify({
-                'status': 'minigame',
-                'game': 'trex',
-                'current_score': current_trex_score,
-                'message': f'🦖 Minigra T-Rex! Twój postęp: {current_trex_score}/20 pkt'
-            })
+        # Wybierz grę (losowo jeśli są dostępne, lub tę jedną dostępną)
+        game, current_score = random.choice(available_games)
+        scan_log.debug("%s Starting %s for player %s", game.icon, game.label, player_id)
+        return jsonify({
+            'status': 'minigame',
+            'game': game.name,
+            'current_score': current_score,
+            'message': f'{game.icon} Minigra {game.label}! Twój postęp: {current_score}/{game.threshold} pkt'
+        })
     
     # JEDNORAZOWE KODY (czerwone, pułapki, różowe)
     else:
-        if qr_code.claimed_by_player_id:
+        # Warunkowy UPDATE zamiast odczytu i przypisania - równoczesne skany tego samego
+        # kodu nie mogą zostać nagrodzone kilka razy
+        if not claim_qr_code(qr_code_id, player_id):
+            db.session.rollback()
             return jsonify({
                 'status': 'error', 
                 'message': 'Ten kod został już wykorzystany.'
             }), 403
         
-        qr_code.claimed_by_player_id = player_id
-        
         # CZERWONY KOD
-        if qr_code.color == 'red':
-            player.score += 50
+        if qr_color == 'red':
+            add_player_score(player, 50)
             message = 'Kod specjalny! Zdobywasz 50 punktów!'
         
         # PUŁAPKA
-        elif qr_code.color == 'white_trap':
-            player.score = max(0, player.score - 25)
+        elif qr_color == 'white_trap':
+            add_player_score(player, -25)
             message = 'Pułapka! Tracisz 25 punktów.'
         
         # RÓŻOWY KOD - FOTO
-        elif qr_code.color == 'pink':
+        elif qr_color == 'pink':
             db.session.commit()
             return jsonify({'status': 'photo_challenge'})
         
@@ -1821,19 +2964,14 @@ def scan_qr():
             message = "Niezidentyfikowany kod."
         
         db.session.commit()
-        emit_leaderboard_update(f'event_{event_id}')
+        player_score_changed(player)
         return jsonify({'status': 'info', 'message': message, 'score': player.score})
 
 # --- API: PLAYER AI Questions ---
 @app.route('/api/player/ai/categories/<int:event_id>', methods=['GET'])
 def get_ai_categories_for_player(event_id):
     """Pobierz aktywne kategorie AI dla gracza"""
-    categories = AICategory.query.filter_by(event_id=event_id, is_enabled=True).all()
-    return jsonify([{
-        'id': c.id,
-        'name': c.name,
-        'difficulty_level': c.difficulty_level
-    } for c in categories])
+    return jsonify(catalog_ai_categories(event_id))
 
 @app.route('/api/player/ai/get_question', methods=['POST'])
 def get_ai_question():
@@ -1846,17 +2984,16 @@ def get_ai_question():
     player = db.session.get(Player, player_id)
     category = db.session.get(AICategory, category_id)
 
-    if not player or not category:
+    if not player or not category or category.event_id != player.event_id or player.event_id != event_id:
         return jsonify({'error': 'Nieprawidłowe dane'}), 404
 
-    # Znajdź pytania na które gracz jeszcze nie odpowiedział
-    answered_ids = [ans.question_id for ans in AIPlayerAnswer.query.filter_by(player_id=player_id).all()]
+    # ✅ Pytanie wydane już z poprzednią odpowiedzią (prefetch) - bez ponownego losowania i liczenia
+    reserved = take_ai_question_reservation(player, category.id)
+    if reserved:
+        return jsonify({'status': 'question', 'question': reserved})
 
-    question = AIQuestion.query.filter(
-        AIQuestion.category_id == category_id,
-        AIQuestion.event_id == event_id,
-        AIQuestion.id.notin_(answered_ids) if answered_ids else True
-    ).order_by(db.func.random()).first()
+    # Następne pytanie z talii gracza, na które jeszcze nie odpowiedział
+    question = next_deck_question(AIQuestion, player.event_id, player.id, category.id)
 
     if not question:
         return jsonify({
@@ -1865,19 +3002,11 @@ def get_ai_question():
         })
 
     # Zwiększ licznik wyświetleń
-    question.times_shown += 1
-    db.session.commit()
+    bump_question_counters(AIQuestion, question.id, times_shown=1)
 
     return jsonify({
         'status': 'question',
-        'question': {
-            'id': question.id,
-            'text': question.text,
-            'option_a': question.option_a,
-            'option_b': question.option_b,
-            'option_c': question.option_c,
-            'category_name': category.name
-        }
+        'question': ai_question_payload(question, category)
     })
 
 @app.route('/api/player/ai/answer', methods=['POST'])
@@ -1903,82 +3032,37 @@ def process_ai_answer():
 
     if answer == question.correct_answer:
         # Zwiększ licznik poprawnych odpowiedzi
-        question.times_correct += 1
+        bump_question_counters(AIQuestion, question.id, times_correct=1)
 
         # Punkty za pytania AI - 5 punktów
-        player.score += 5
-
-        # ✅ LOGIKA ODKRYWANIA HASŁA: Sprawdź tryb odkrywania hasła
-        password_mode = get_game_state(player.event_id, 'password_reveal_mode', 'auto')
-
-        if password_mode == 'auto':
-            # Oblicz maksymalną liczbę punktów możliwych do zdobycia
-            total_questions = Question.query.filter_by(event_id=player.event_id).count()
-            total_ai_questions = AIQuestion.query.filter_by(event_id=player.event_id).count()
-            bonus_multiplier = int(get_game_state(player.event_id, 'bonus_multiplier', '1'))
-
-            max_possible_points = (total_questions * 10 * bonus_multiplier) + (total_ai_questions * 5)
-
-            # Pobierz procent odkrywania
-            reveal_percentage = int(get_game_state(player.event_id, 'password_reveal_percentage', '50'))
-
-            # Oblicz próg punktów na jedną literę
-            if max_possible_points > 0 and reveal_percentage > 0:
-                points_per_letter = (max_possible_points * reveal_percentage) / 100
+        add_player_score(player, 5)
 
-                # Oblicz ile liter gracz powinien mieć odkrytych
-                letters_to_reveal = int(player.score / points_per_letter) if points_per_letter > 0 else 0
-
-                # Pobierz aktualny stan hasła
-                password_value = get_game_state(player.event_id, 'game_password', 'SAPEREVENT')
-                revealed_indices_str = get_game_state(player.event_id, 'revealed_password_indices', '')
-
-                # Parsuj odkryte indeksy
-                revealed_indices = set()
-                if revealed_indices_str:
-                    revealed_indices = set(map(int, revealed_indices_str.split(',')))
-
-                # Znajdź wszystkie indeksy liter (pomijając spacje)
-                all_letter_indices = [i for i in range(len(password_value)) if password_value[i] != ' ']
-
-                # Oblicz ile liter trzeba odkryć
-                current_revealed_count = len([i for i in revealed_indices if i < len(password_value) and password_value[i] != ' '])
-                letters_to_add = min(letters_to_reveal - current_revealed_count, len(all_letter_indices) - current_revealed_count)
-
-                # Odkryj brakujące litery
-                if letters_to_add > 0:
-                    import random
-                    available_indices = [i for i in all_letter_indices if i not in revealed_indices]
-
-                    for _ in range(letters_to_add):
-                        if available_indices:
-                            revealed_index = random.choice(available_indices)
-                            revealed_indices.add(revealed_index)
-                            available_indices.remove(revealed_index)
-
-                    # Zapisz zaktualizowane indeksy
-                    revealed_indices_str = ','.join(map(str, sorted(revealed_indices)))
-                    set_game_state(player.event_id, 'revealed_password_indices', revealed_indices_str)
-
-                    emit_password_update(f'event_{player.event_id}')
+        # ✅ Odkryj litery hasła zgodnie z wynikiem gracza (tryb auto)
+        auto_reveal_password(player)
 
         db.session.commit()
-        emit_leaderboard_update(f'event_{player.event_id}')
+        player_score_changed(player)
 
-        return jsonify({
+        result = {
             'correct': True,
             'score': player.score,
             'message': 'Poprawna odpowiedź! +5 punktów'
-        })
+        }
     else:
         # Brak odjęcia punktów za błędną odpowiedź w pytaniach AI
         db.session.commit()
 
-        return jsonify({
+        result = {
             'correct': False,
             'score': player.score,
             'message': 'Niepoprawna odpowiedź'
-        })
+        }
+
+    # ✅ Na życzenie klienta od razu następne pytanie z tej kategorii (oszczędza drugie żądanie),
+    # ale tylko gdy gracz mógłby teraz zeskanować biały kod - to samo ograniczenie co przy skanie
+    if data.get('prefetch_next') and arm_scan_cooldown(player.event_id, player.id, 'white') == 0:
+        result['next_question'] = reserve_next_ai_question(player, question.category_id)
+    return jsonify(result)
 
 @app.route('/api/player/answer', methods=['POST'])
 def process_answer():
@@ -1987,80 +3071,31 @@ def process_answer():
     player, question = db.session.get(Player, player_id), db.session.get(Question, question_id)
     if not player or not question: return jsonify({'error': 'Invalid data'}), 404
     
+    first_answer = db.session.query(PlayerAnswer.id).filter_by(
+        event_id=player.event_id, question_id=question_id
+    ).first() is None
     db.session.add(PlayerAnswer(player_id=player_id, question_id=question_id, event_id=player.event_id))
+    bump_event_stats(player.event_id, answer_count=1, answered_question_count=1 if first_answer else 0)
     bonus = int(get_game_state(player.event_id, 'bonus_multiplier', 1))
     
-    # Zwiększ licznik wyświetleń
-    question.times_shown += 1
+    # Zwiększ liczniki wyświetleń i poprawnych odpowiedzi jednym UPDATE
+    is_correct = answer == question.correct_answer
+    bump_question_counters(Question, question_id, times_shown=1, times_correct=1 if is_correct else 0)
     
-    if answer == question.correct_answer:
-        # Zwiększ licznik poprawnych odpowiedzi
-        question.times_correct += 1
-        
+    if is_correct:
         points = 10 * bonus
-        player.score += points
+        add_player_score(player, points)
         
-        # ✅ ZMODYFIKOWANA LOGIKA: Sprawdź tryb odkrywania hasła
-        password_mode = get_game_state(player.event_id, 'password_reveal_mode', 'auto')
-
-        if password_mode == 'auto':
-            # Oblicz maksymalną liczbę punktów możliwych do zdobycia
-            total_questions = Question.query.filter_by(event_id=player.event_id).count()
-            total_ai_questions = AIQuestion.query.filter_by(event_id=player.event_id).count()
-            bonus_multiplier = int(get_game_state(player.event_id, 'bonus_multiplier', '1'))
-
-            max_possible_points = (total_questions * 10 * bonus_multiplier) + (total_ai_questions * 5)
-
-            # Pobierz procent odkrywania
-            reveal_percentage = int(get_game_state(player.event_id, 'password_reveal_percentage', '50'))
-
-            # Oblicz próg punktów na jedną literę
-            if max_possible_points > 0 and reveal_percentage > 0:
-                points_per_letter = (max_possible_points * reveal_percentage) / 100
+        # ✅ Odkryj litery hasła zgodnie z wynikiem gracza (tryb auto)
+        auto_reveal_password(player)
 
-                # Oblicz ile liter gracz powinien mieć odkrytych
-                letters_to_reveal = int(player.score / points_per_letter) if points_per_letter > 0 else 0
-
-                # Pobierz aktualny stan hasła
-                password_value = get_game_state(player.event_id, 'game_password', 'SAPEREVENT')
-                revealed_indices_str = get_game_state(player.event_id, 'revealed_password_indices', '')
-
-                # Parsuj odkryte indeksy
-                revealed_indices = set()
-                if revealed_indices_str:
-                    revealed_indices = set(map(int, revealed_indices_str.split(',')))
-
-                # Znajdź wszystkie indeksy liter (pomijając spacje)
-                all_letter_indices = [i for i in range(len(password_value)) if password_value[i] != ' ']
-
-                # Oblicz ile liter trzeba odkryć
-                current_revealed_count = len([i for i in revealed_indices if i < len(password_value) and password_value[i] != ' '])
-                letters_to_add = min(letters_to_reveal - current_revealed_count, len(all_letter_indices) - current_revealed_count)
-
-                # Odkryj brakujące litery
-                if letters_to_add > 0:
-                    import random
-                    available_indices = [i for i in all_letter_indices if i not in revealed_indices]
-
-                    for _ in range(letters_to_add):
-                        if available_indices:
-                            revealed_index = random.choice(available_indices)
-                            revealed_indices.add(revealed_index)
-                            available_indices.remove(revealed_index)
-
-                    # Zapisz zaktualizowane indeksy
-                    revealed_indices_str = ','.join(map(str, sorted(revealed_indices)))
-                    set_game_state(player.event_id, 'revealed_password_indices', revealed_indices_str)
-
-                    emit_password_update(f'event_{player.event_id}')
-        
         db.session.commit()
-        emit_leaderboard_update(f'event_{player.event_id}')
+        player_score_changed(player)
         return jsonify({'correct': True, 'letter': question.letter_to_reveal, 'score': player.score})
     else:
-        player.score = max(0, player.score - 5)
+        add_player_score(player, -5)
         db.session.commit()
-        emit_leaderboard_update(f'event_{player.event_id}')
+        player_score_changed(player)
         return jsonify({'correct': False, 'score': player.score})
 
 # 🎉 ENDPOINTY DLA GŁOSOWANIA NA ZDJĘCIA
@@ -2110,11 +3145,7 @@ def vote_photo(photo_id):
     db.session.commit()
     
     # Wyemituj aktualizację do wszystkich
-    room = f'event_{photo.event_id}'
-    socketio.emit('photo_vote_update', {
-        'photo_id': photo_id, 
-        'votes': photo.votes
-    }, room=room)
+    emit_photo_vote_update(photo.event_id, photo_id, photo.votes)
     
     return jsonify({
         'action': action,
@@ -2150,10 +3181,11 @@ def get_player_dashboard_state():
     game_state = get_full_game_state(event_id)
 
     # Policz aktywnych graczy
-    active_players = Player.query.filter_by(event_id=event_id).count()
+    stats = get_event_stats(event_id)
+    active_players = stats.player_count
 
     # Policz dostępne punkty (pytania + AI questions)
-    total_questions = Question.query.filter_by(event_id=event_id).count()
+    total_questions = stats.question_count
     total_ai_questions = AIQuestion.query.filter_by(event_id=event_id).count()
 
     # Policz ile pytań gracz już odpowiedział
@@ -2171,33 +3203,11 @@ def get_player_dashboard_state():
     # Oblicz łączne zdobyte punkty (teoretycznie powinny być równe player.score)
     total_earned = player.score
 
-    # Hasło
-    password_value = game_state.get('game_password', 'SAPEREVENT')
-    revealed_indices_str = game_state.get('revealed_password_indices', '')
-    revealed_indices = set()
-    if revealed_indices_str:
-        revealed_indices = set(map(int, revealed_indices_str.split(',')))
-
-    displayed_password = ""
-    for i, char in enumerate(password_value):
-        if char == ' ':
-            displayed_password += '  '
-        elif i in revealed_indices:
-            displayed_password += char
-        else:
-            displayed_password += '_'
+    # Hasło (pełny stan gry zawiera już gotowy tekst - klucza game_password w nim nie ma)
+    displayed_password = game_state['password']
 
     # Czas pozostały
-    time_remaining = 0
-    if game_state.get('game_active') == 'True' and game_state.get('is_timer_running') == 'True':
-        end_time_str = game_state.get('game_end_time')
-        if end_time_str:
-            try:
-                end_time = datetime.fromisoformat(end_time_str)
-                now = datetime.utcnow()
-                time_remaining = max(0, int((end_time - now).total_seconds()))
-            except:
-                time_remaining = 0
+    time_remaining = int(game_state['time_left']) if game_state['game_active'] else 0
 
     # Komunikat hosta (ostatni wysłany)
     host_message = game_state.get('host_message', '')
@@ -2206,6 +3216,7 @@ def get_player_dashboard_state():
         'game_name': event.name,
         'player_name': player.name,
         'player_score': player.score,
+        'player_rank': get_leaderboard(event_id).rank_of(player.id),
         'active_players': active_players,
         'total_points_earned': total_earned,
         'points_available': points_available,
@@ -2214,7 +3225,7 @@ def get_player_dashboard_state():
         'time_remaining': time_remaining,
         'password_display': displayed_password,
         'host_message': host_message,
-        'game_active': game_state.get('game_active') == 'True'
+        'game_active': game_state['game_active']
     })
 
 @app.route('/api/player/selfies', methods=['GET'])
@@ -2272,11 +3283,7 @@ def vote_player_selfie():
     db.session.commit()
 
     # Wyemituj aktualizację
-    room = f'event_{event_id}'
-    socketio.emit('photo_vote_update', {
-        'photo_id': photo_id,
-        'votes': photo.votes
-    }, room=room)
+    emit_photo_vote_update(event_id, photo_id, photo.votes)
 
     return jsonify({
         'success': True,
@@ -2295,107 +3302,32 @@ def complete_minigame():
     if not player:
         return jsonify({'error': 'Nie znaleziono gracza'}), 404
     
-    # Sprawdź czy minigra jest aktywna
-    if game_type == 'tetris':
-        tetris_disabled = get_game_state(player.event_id, 'minigame_tetris_disabled', 'False')
-        if tetris_disabled == 'True':
-            return jsonify({'error': 'Ta minigra została wyłączona'}), 403
-        score_key = f'minigame_tetris_score_{player_id}'
-    elif game_type == 'arkanoid':
-        arkanoid_disabled = get_game_state(player.event_id, 'minigame_arkanoid_disabled', 'False')
-        if arkanoid_disabled == 'True':
-            return jsonify({'error': 'Ta minigra została wyłączona'}), 403
-        score_key = f'minigame_arkanoid_score_{player_id}'
-    elif game_type == 'snake':
-        snake_disabled = get_game_state(player.event_id, 'minigame_snake_disabled', 'False')
-        if snake_disabled == 'True':
-            return jsonify({'error': 'Ta minigra została wyłączona'}), 403
-        score_key = f'minigame_snake_score_{player_id}'
-    elif game_type == 'pacman':
-        pacman_disabled = get_game_state(player.event_id, 'minigame_pacman_disabled', 'False')
-        if pacman_disabled == 'True':
-            return jsonify({'error': 'Ta minigra została wyłączona'}), 403
-        score_key = f'minigame_pacman_score_{player_id}'
-    elif game_type == 'trex':
-        trex_disabled = get_game_state(player.event_id, 'minigame_trex_disabled', 'False')
-        if trex_disabled == 'True':
-            return jsonify({'error': 'Ta minigra została wyłączona'}), 403
-        score_key = f'minigame_trex_score_{player_id}'
-    else:
+    # Sprawdź czy minigra istnieje i jest aktywna
+    game = MINIGAMES_BY_NAME.get(game_type)
+    if not game:
         return jsonify({'error': 'Nieznany typ minigry'}), 400
+    if not minigames_enabled(player.event_id)[game.name]:
+        return jsonify({'error': 'Ta minigra została wyłączona'}), 403
 
-    # Pobierz aktualny wynik gracza w tej minigrze
-    current_score = int(get_game_state(player.event_id, score_key, '0'))
-
-    # Dodaj zdobyte punkty do sumy
-    new_score = current_score + score
-    set_game_state(player.event_id, score_key, str(new_score))
+    # Dodaj zdobyte punkty do sumy (upsert - pierwszy wiersz postępu też bez wyścigu)
+    new_score, completed_at = add_minigame_progress(player.event_id, player_id, game_type, score)
 
-    game_name_map = {'tetris': 'Tetris', 'arkanoid': 'Arkanoid', 'snake': 'Snake', 'pacman': 'PacMan', 'trex': 'T-Rex'}
-    game_name = game_name_map.get(game_type, 'Unknown')
+    game_name = game.label
     
-    # Sprawdź czy gracz osiągnął 20 punktów
-    if new_score >= 20:
+    # Sprawdź czy gracz osiągnął próg ukończenia
+    if new_score >= game.threshold:
         # Gracz ukończył wyzwanie - przyznaj nagrody
+        if not completed_at:
+            mark_minigame_completed(player.event_id, player_id, game_type)
         bonus = int(get_game_state(player.event_id, 'bonus_multiplier', 1))
         points = 10 * bonus
-        player.score += points
-
-        # ✅ LOGIKA ODKRYWANIA HASŁA: Sprawdź tryb odkrywania hasła
-        password_mode = get_game_state(player.event_id, 'password_reveal_mode', 'auto')
-
-        if password_mode == 'auto':
-            # Oblicz maksymalną liczbę punktów możliwych do zdobycia
-            total_questions = Question.query.filter_by(event_id=player.event_id).count()
-            total_ai_questions = AIQuestion.query.filter_by(event_id=player.event_id).count()
-            bonus_multiplier = int(get_game_state(player.event_id, 'bonus_multiplier', '1'))
-
-            max_possible_points = (total_questions * 10 * bonus_multiplier) + (total_ai_questions * 5)
-
-            # Pobierz procent odkrywania
-            reveal_percentage = int(get_game_state(player.event_id, 'password_reveal_percentage', '50'))
-
-            # Oblicz próg punktów na jedną literę
-            if max_possible_points > 0 and reveal_percentage > 0:
-                points_per_letter = (max_possible_points * reveal_percentage) / 100
-
-                # Oblicz ile liter gracz powinien mieć odkrytych
-                letters_to_reveal = int(player.score / points_per_letter) if points_per_letter > 0 else 0
-
-                # Pobierz aktualny stan hasła
-                password_value = get_game_state(player.event_id, 'game_password', 'SAPEREVENT')
-                revealed_indices_str = get_game_state(player.event_id, 'revealed_password_indices', '')
-
-                # Parsuj odkryte indeksy
-                revealed_indices = set()
-                if revealed_indices_str:
-                    revealed_indices = set(map(int, revealed_indices_str.split(',')))
-
-                # Znajdź wszystkie indeksy liter (pomijając spacje)
-                all_letter_indices = [i for i in range(len(password_value)) if password_value[i] != ' ']
-
-                # Oblicz ile liter trzeba odkryć
-                current_revealed_count = len([i for i in revealed_indices if i < len(password_value) and password_value[i] != ' '])
-                letters_to_add = min(letters_to_reveal - current_revealed_count, len(all_letter_indices) - current_revealed_count)
+        add_player_score(player, points)
 
-                # Odkryj brakujące litery
-                if letters_to_add > 0:
-                    import random
-                    available_indices = [i for i in all_letter_indices if i not in revealed_indices]
-
-                    for _ in range(letters_to_add):
-                        if available_indices:
-                            revealed_index = random.choice(available_indices)
-                            revealed_indices.add(revealed_index)
-                            available_indices.remove(revealed_index)
-
-                    # Zapisz zaktualizowane indeksy
-                    revealed_indices_str = ','.join(map(str, sorted(revealed_indices)))
-                    set_game_state(player.event_id, 'revealed_password_indices', revealed_indices_str)
+        # ✅ Odkryj litery hasła zgodnie z wynikiem gracza (tryb auto)
+        revealed_letter = ', '.join(auto_reveal_password(player))
 
         db.session.commit()
-        emit_password_update(f'event_{player.event_id}')
-        emit_leaderboard_update(f'event_{player.event_id}')
+        player_score_changed(player)
         
         return jsonify({
             'success': True,
@@ -2407,7 +3339,7 @@ def complete_minigame():
             'message': f'WYZWANIE {game_name.upper()} UKOŃCZONE! Zdobyłeś {new_score} pkt i otrzymujesz {points} punktów!' + (f' Odsłonięta litera: {revealed_letter}' if revealed_letter else '')
         })
     else:
-        # Gracz jeszcze nie osiągnął 20 punktów - może kontynuować
+        # Gracz jeszcze nie osiągnął progu - może kontynuować
         db.session.commit()
         return jsonify({
             'success': True,
@@ -2415,7 +3347,7 @@ def complete_minigame():
             'points_earned': 0,
             'total_score': player.score,
             f'{game_type}_score': new_score,
-            'message': f'Postęp w {game_name}: {new_score}/20 pkt. Zeskanuj kod ponownie, aby kontynuować!'
+            'message': f'Postęp w {game_name}: {new_score}/{game.threshold} pkt. Zeskanuj kod ponownie, aby kontynuować!'
         })
 
 # --- API: PASSWORD MANAGEMENT ---
@@ -2438,8 +3370,7 @@ def set_password():
     if len(new_password) > 50:
         return jsonify({'error': 'Hasło może mieć maksymalnie 50 znaków'}), 400
     
-    set_game_state(event_id, 'game_password', new_password)
-    set_game_state(event_id, 'revealed_password_indices', '')
+    update_game_state(event_id, {'game_password': new_password, 'revealed_password_indices': ''})
     
     emit_password_update(f'event_{event_id}')
     
@@ -2499,29 +3430,17 @@ def reveal_password_letters_manual():
     if not indices_to_reveal:
         return jsonify({'error': 'Nie wybrano żadnych liter'}), 400
     
-    current_revealed = get_game_state(event_id, 'revealed_password_indices', '')
-    
-    revealed_set = set()
-    if current_revealed:
-        try:
-            revealed_set = set(map(int, current_revealed.split(',')))
-        except (ValueError, AttributeError):
-            revealed_set = set()
-    
-    for idx in indices_to_reveal:
-        revealed_set.add(int(idx))
-    
-    revealed_indices_str = ','.join(map(str, sorted(revealed_set)))
-    set_game_state(event_id, 'revealed_password_indices', revealed_indices_str)
-    
-    emit_password_update(f'event_{event_id}')
+    try:
+        reveal_password_indices(event_id, indices_to_reveal)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     
-    password = get_game_state(event_id, 'game_password', 'SAPEREVENT')
-    revealed_chars = [password[i] for i in indices_to_reveal if i < len(password)]
+    password = password_state(event_id)['password']
+    revealed_chars = [password[i] for i in map(int, indices_to_reveal)]
     
     return jsonify({
         'message': f'Odsłonięto litery: {", ".join(revealed_chars)}',
-        'revealed_indices': revealed_indices_str
+        'revealed_indices': get_game_state(event_id, 'revealed_password_indices', '')
     })
 
 @app.route('/api/host/password/state', methods=['GET'])
@@ -2530,31 +3449,14 @@ def get_password_state():
     """Pobierz aktualny stan hasła"""
     event_id = session['host_event_id']
     
-    password = get_game_state(event_id, 'game_password', 'SAPEREVENT')
-    revealed_indices_str = get_game_state(event_id, 'revealed_password_indices', '')
+    view = password_state(event_id)
     mode = get_game_state(event_id, 'password_reveal_mode', 'auto')
     percentage = int(get_game_state(event_id, 'password_reveal_percentage', '50'))
 
-    revealed_indices = []
-    if revealed_indices_str:
-        try:
-            revealed_indices = list(map(int, revealed_indices_str.split(',')))
-        except (ValueError, AttributeError):
-            revealed_indices = []
-
-    displayed_password = ""
-    for i, char in enumerate(password):
-        if char == ' ':
-            displayed_password += '  '
-        elif i in revealed_indices:
-            displayed_password += char
-        else:
-            displayed_password += '_'
-
     return jsonify({
-        'password': password,
-        'revealed_letters': revealed_indices_str,
-        'displayed_password': displayed_password,
+        'password': view['password'],
+        'revealed_letters': get_game_state(event_id, 'revealed_password_indices', ''),
+        'displayed_password': view['display'],
         'mode': mode,
         'reveal_percentage': percentage
     })
@@ -2563,118 +3465,369 @@ def get_password_state():
 # ===================================================================
 # --- Gniazda (SocketIO) ---
 # ===================================================================
+# Co ile sekund pętla zegara wysyła korektę timer_state (klienci interpolują pomiędzy)
+TIMER_RESYNC_INTERVAL = float(os.environ.get('TIMER_RESYNC_INTERVAL', 15))
+
+def build_timer_state(event_id, state=None):
+    """Autorytatywny stan zegara - klient odlicza lokalnie (static/game_clock.js)"""
+    state = load_game_state(event_id) if state is None else state
+    now = time.time()
+    is_active = state.get('game_active') == 'True'
+    is_running = is_active and state.get('is_timer_running') == 'True'
+    speed = int(state.get('time_speed', 1))
+    time_left = compute_time_left(state, now) if is_active else 0
+    time_elapsed, time_elapsed_with_pauses = compute_time_elapsed(state)
+    return {
+        'game_active': is_active,
+        'running': is_running,
+        'speed': speed,
+        'time_left': time_left,
+        'deadline': (now + time_left / speed) * 1000 if is_running and speed > 0 else None,
+        'time_elapsed': time_elapsed,
+        'time_elapsed_with_pauses': time_elapsed_with_pauses,
+        'server_time': now * 1000
+    }
+
+def emit_timer_state(event_id, state=None, to=None):
+    socketio.emit('timer_state', build_timer_state(event_id, state), room=to or f'event_{event_id}')
+
 def emit_full_state_update(room):
     """Emit full game state to all clients in the room"""
     event_id = int(room.split('_')[1])
     state = get_full_game_state(event_id)
     
-    print(f"📤 Emitting full state to {room}:")
-    print(f"   - game_active: {state['game_active']}")
-    print(f"   - is_timer_running: {state['is_timer_running']}")
-    print(f"   - time_left: {state['time_left']}")
+    game_log.debug("📤 Emitting full state to %s: game_active=%s, is_timer_running=%s, time_left=%s",
+                   room, state['game_active'], state['is_timer_running'], state['time_left'])
     
     socketio.emit('game_state_update', state, room=room)
+    emit_timer_state(event_id)
+
+# --- Harmonogram rozgłoszeń ---
+# Aktualizacje rankingu, hasła i głosów na zdjęcia nie są wysyłane w handlerze żądania,
+# tylko zlecane: zlecenia tego samego typu dla pokoju łączą się w jedno i są wysyłane
+# najwyżej BROADCAST_MAX_RATE razy na sekundę (w tle - handler nie czeka).
+# Zdarzenia krytyczne (game_over, game_state_update, timer_state) idą od razu przez socketio.emit.
+BROADCAST_MAX_RATE = float(os.environ.get('BROADCAST_MAX_RATE', 4))
+
+_pending_broadcasts = {}  # (room, kind) -> funkcja wysyłająca (ostatnio zlecona)
+_last_broadcast = {}      # (room, kind) -> time.monotonic() ostatniej wysyłki (tylko z ostatniego odstępu)
+
+def schedule_broadcast(room, kind, send):
+    """Zleca wysyłkę send() do pokoju; nowsze zlecenie tego samego typu zastępuje oczekujące"""
+    key = (room, kind)
+    already_pending = key in _pending_broadcasts
+    _pending_broadcasts[key] = send
+    if already_pending:
+        return
+    delay = 0.0
+    if BROADCAST_MAX_RATE > 0:
+        delay = max(0.0, _last_broadcast.get(key, 0.0) + 1.0 / BROADCAST_MAX_RATE - time.monotonic())
+    socketio.start_background_task(_flush_broadcast, key, delay)
+
+def _flush_broadcast(key, delay):
+    socketio.sleep(delay)
+    send = _pending_broadcasts.pop(key, None)
+    now = time.monotonic()
+    if BROADCAST_MAX_RATE > 0:
+        # Wpis starszy niż odstęp między wysyłkami nic już nie opóźnia - bez tego słownik
+        # rósłby o klucz na każde zdjęcie (photo_vote_<id>) przez cały czas życia procesu
+        interval = 1.0 / BROADCAST_MAX_RATE
+        for stale in [k for k, sent in _last_broadcast.items() if sent + interval <= now]:
+            del _last_broadcast[stale]
+        _last_broadcast[key] = now
+    if send is None:
+        return
+    try:
+        with app.app_context():
+            send()
+    except Exception as e:
+        log.error("❌ Błąd rozgłoszenia %s do %s: %s", key[1], key[0], e)
+
+def _app_context():
+    """Kontekst aplikacji tylko poza żądaniem - zagnieżdżony app_context() przy wyjściu
+    zamyka sesję SQLAlchemy żądania (DetachedInstanceError w handlerze)"""
+    return nullcontext() if has_app_context() else app.app_context()
+
+# --- Ranking: protokół delt ---
+# Klient dostaje pełny 'leaderboard_snapshot' przy dołączeniu, a potem tylko
+# 'leaderboard_delta' z graczami, którym zmienił się wynik lub miejsce.
+# Widok obejmuje tylko LEADERBOARD_TOP_N najlepszych - kto z niego wypada, trafia do 'removed'.
+# Każda delta dostaje kolejną wersję z licznika wspólnego dla eventu (Redis INCR przy
+# skonfigurowanej kolejce wiadomości, inaczej licznik w procesie), więc delty z różnych
+# workerów tworzą jeden ciąg. Przy luce w wersjach klient prosi o nowy snapshot przez
+# 'leaderboard_resync' - snapshot idzie tylko do niego. Deltę wysyła worker, który
+# zmienił wynik; pozostałe tylko przesuwają swój widok (_apply_remote_change).
+_leaderboard_views = {}     # event_id -> {player_id: (name, score, rank)} - ostatnio wysłany widok
+_leaderboard_versions = {}  # event_id -> wersja (bez kolejki wiadomości)
+
+def _leaderboard_version_key(event_id):
+    return f'leaderboard:version:{event_id}'
+
+def _next_leaderboard_version(event_id):
+    if SOCKETIO_MESSAGE_QUEUE:
+        return _get_redis_client().incr(_leaderboard_version_key(event_id))
+    _leaderboard_versions[event_id] = _leaderboard_versions.get(event_id, 0) + 1
+    return _leaderboard_versions[event_id]
+
+def _current_leaderboard_version(event_id):
+    if SOCKETIO_MESSAGE_QUEUE:
+        return int(_get_redis_client().get(_leaderboard_version_key(event_id)) or 0)
+    return _leaderboard_versions.get(event_id, 0)
+
+def _leaderboard_rows(board):
+    return {player_id: (name, score, rank) for player_id, name, score, rank in board.top(LEADERBOARD_TOP_N)}
+
+def sync_leaderboard_view(event_id, board):
+    """Deltę tej zmiany wysłał inny worker - tu tylko przesuwamy widok, bez emisji"""
+    if event_id in _leaderboard_views:
+        _leaderboard_views[event_id] = _leaderboard_rows(board)
+
+def _leaderboard_entry(player_id, entry):
+    name, score, rank = entry
+    return {'id': player_id, 'name': name, 'score': score, 'rank': rank}
+
+def refresh_leaderboard(event_id):
+    """Przelicza ranking eventu; zwraca deltę względem poprzedniego widoku albo None"""
+    entries = _leaderboard_rows(get_leaderboard(event_id))
+    view = _leaderboard_views.get(event_id, {})  # brak widoku = cały ranking jako zmiany
+    
+    changes = [_leaderboard_entry(player_id, entry) for player_id, entry in entries.items()
+               if view.get(player_id) != entry]
+    removed = [player_id for player_id in view if player_id not in entries]
+    _leaderboard_views[event_id] = entries
+    if not changes and not removed:
+        return None
+    
+    return {
+        'version': _next_leaderboard_version(event_id),
+        'changes': changes,
+        'removed': removed
+    }
+
+def leaderboard_snapshot(event_id):
+    # Wersja przed odczytem rankingu - snapshot jest co najmniej tak świeży jak ta wersja,
+    # a kolejne delty niosą wartości bezwzględne, więc ich ponowne nałożenie nie szkodzi
+    version = _current_leaderboard_version(event_id)
+    players = sorted(_leaderboard_rows(get_leaderboard(event_id)).items(), key=lambda item: item[1][2])
+    return {
+        'version': version,
+        'players': [_leaderboard_entry(player_id, entry) for player_id, entry in players]
+    }
+
+def _send_leaderboard_delta(room):
+    event_id = int(room.split('_')[1])
+    with _app_context():
+        delta = refresh_leaderboard(event_id)
+    if delta:
+        socketio.emit('leaderboard_delta', delta, room=room)
 
 def emit_leaderboard_update(room):
+    schedule_broadcast(room, 'leaderboard', lambda: _send_leaderboard_delta(room))
+
+def emit_leaderboard_snapshot(event_id, to):
+    """Pełny ranking tylko dla jednego klienta (dołączenie / resync), nigdy dla pokoju"""
+    socketio.emit('leaderboard_snapshot', leaderboard_snapshot(int(event_id)), to=to)
+
+def _send_password_update(room):
     event_id = int(room.split('_')[1])
-    with app.app_context():
-        players = Player.query.filter_by(event_id=event_id).order_by(Player.score.desc()).all()
-        socketio.emit('leaderboard_update', [{'name': p.name, 'score': p.score} for p in players], room=room)
+    with _app_context():
+        socketio.emit('password_update', password_state(event_id)['display'], room=room)
 
 def emit_password_update(room):
-     event_id = int(room.split('_')[1])
-     with app.app_context():
-        socketio.emit('password_update', get_full_game_state(event_id)['password'], room=room)
+    schedule_broadcast(room, 'password', lambda: _send_password_update(room))
+
+def emit_photo_vote_update(event_id, photo_id, votes):
+    room = f'event_{event_id}'
+    payload = {'photo_id': photo_id, 'votes': votes}
+    schedule_broadcast(room, f'photo_vote_{photo_id}', lambda: socketio.emit('photo_vote_update', payload, room=room))
+
+# --- Wybór lidera dla pętli zegara ---
+# Pętla update_timers startuje w każdym procesie (worker gunicorna, socketio.run),
+# ale koniec czasu i korekty zegara obsługuje tylko jeden - ten, który trzyma blokadę.
+# PostgreSQL: pg_try_advisory_lock na osobnym połączeniu (zwalniana, gdy proces padnie
+# i połączenie się zamknie). SQLite: blokada pliku obok bazy (system zwalnia ją przy
+# śmierci procesu). Pozostałe procesy co TIMER_LEADER_RETRY s próbują ją przejąć.
+TIMER_LEADER_LOCK_KEY = 72_601_009
+TIMER_LEADER_RETRY = float(os.environ.get('TIMER_LEADER_RETRY', 5))
+
+try:
+    import fcntl
+except ImportError:  # Windows (start.bat)
+    fcntl = None
+    import msvcrt
+
+_timer_leader = {'kind': None, 'handle': None, 'next_attempt': 0.0}
+
+def _timer_lock_file_path():
+    path = os.environ.get('TIMER_LOCK_FILE')
+    if path:
+        return path
+    database = db.engine.url.database
+    if database and database != ':memory:':
+        return os.path.abspath(database) + '.timer.lock'
+    import tempfile
+    return os.path.join(tempfile.gettempdir(), 'saper_timer.lock')
+
+def _acquire_pg_leader_lock():
+    conn = db.engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+    try:
+        acquired = conn.execute(db.text('SELECT pg_try_advisory_lock(:key)'),
+                                {'key': TIMER_LEADER_LOCK_KEY}).scalar()
+    except Exception:
+        conn.invalidate()
+        conn.close()
+        raise
+    if acquired:
+        return conn
+    conn.close()
+    return None
+
+def _acquire_file_leader_lock():
+    handle = open(_timer_lock_file_path(), 'a+')
+    try:
+        handle.seek(0)
+        if fcntl:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        handle.close()
+        return None
+    return handle
+
+def _pg_leader_lock_alive(conn):
+    try:
+        conn.execute(db.text('SELECT 1'))
+        return True
+    except Exception as e:
+        timer_log.warning("⚠️  Utracono połączenie z blokadą lidera zegara: %s", e)
+        return False
+
+def release_timer_leadership():
+    """Oddaje blokadę lidera (np. przy zamykaniu procesu)"""
+    kind, handle = _timer_leader['kind'], _timer_leader['handle']
+    _timer_leader['kind'] = _timer_leader['handle'] = None
+    if handle is None:
+        return
+    try:
+        if kind == 'pg':
+            # Zamknięcie fizycznego połączenia zwalnia blokadę sesyjną;
+            # zwykłe close() oddałoby je do puli razem z blokadą
+            handle.invalidate()
+            handle.close()
+        else:
+            handle.close()
+    except Exception:
+        pass
+    timer_log.info("👋 Proces %s oddał rolę lidera zegara", os.getpid())
+
+def is_timer_leader():
+    """Czy ten proces prowadzi zegar. Co TIMER_LEADER_RETRY s odświeża lub próbuje przejąć blokadę."""
+    now = time.monotonic()
+    if now < _timer_leader['next_attempt']:
+        return _timer_leader['handle'] is not None
+    _timer_leader['next_attempt'] = now + TIMER_LEADER_RETRY
+    
+    if _timer_leader['handle'] is not None:
+        if _timer_leader['kind'] == 'pg' and not _pg_leader_lock_alive(_timer_leader['handle']):
+            release_timer_leadership()
+        return _timer_leader['handle'] is not None
+    
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            kind, handle = 'pg', _acquire_pg_leader_lock()
+        else:
+            kind, handle = 'file', _acquire_file_leader_lock()
+    except Exception as e:
+        timer_log.error("❌ Błąd przejmowania blokady lidera zegara: %s", e)
+        return False
+    
+    if handle is None:
+        return False
+    _timer_leader['kind'], _timer_leader['handle'] = kind, handle
+    timer_log.info("👑 Proces %s został liderem zegara (%s)", os.getpid(), kind)
+    return True
 
 _background_task_started = False
 _background_task_lock = False
 
+# Metryki pętli zegara (czas jednej iteracji) - podgląd: /api/admin/metrics/timers
+_tick_metrics = {
+    'iterations': 0,
+    'active_events': 0,
+    'last_duration_ms': 0.0,
+    'max_duration_ms': 0.0,
+    'avg_duration_ms': 0.0
+}
+
+def _record_tick_duration(duration_ms, active_events):
+    _tick_metrics['iterations'] += 1
+    _tick_metrics['active_events'] = active_events
+    _tick_metrics['last_duration_ms'] = duration_ms
+    _tick_metrics['max_duration_ms'] = max(_tick_metrics['max_duration_ms'], duration_ms)
+    # Średnia krocząca (EMA), żeby nie trzymać historii
+    _tick_metrics['avg_duration_ms'] += (duration_ms - _tick_metrics['avg_duration_ms']) * 0.1
+
 def update_timers():
-    """Background task that sends timer updates every second"""
-    print("🚀 Timer background task started")
+    """Background task: co sekundę sprawdza koniec czasu, co TIMER_RESYNC_INTERVAL wysyła korektę zegara"""
+    timer_log.info("🚀 Timer background task started")
     
-    last_tick_times = {}  # Śledzi ostatni czas tick'a dla każdego eventu
+    last_resync = {}  # event_id -> time.time() ostatniego timer_state z pętli
     
     while True:
+        # Tylko jeden proces obsługuje koniec czasu - reszta czeka w gotowości
+        with app.app_context():
+            leader = is_timer_leader()
+        if not leader:
+            last_resync.clear()
+            socketio.sleep(1)
+            continue
+        
+        tick_started = time.perf_counter()
+        states = {}
         try:
             with app.app_context():
-                # Znajdź wszystkie aktywne eventy
-                active_events = db.session.query(GameState.event_id).filter_by(
-                    key='game_active', 
-                    value='True'
-                ).distinct().all()
-                event_ids = [e[0] for e in active_events]
+                # ✅ Stan wszystkich aktywnych eventów jednym zapytaniem
+                states = load_active_game_states()
                 
-                current_time = datetime.utcnow()
+                # Policz wszystkie payloady w pamięci, potem wyemituj je hurtem.
+                # Klienci odliczają sami - co sekundę nic nie jest wysyłane,
+                # tylko rzadka korekta timer_state.
+                now = time.time()
+                resyncs = []
+                expired = []
+                for event_id, state in states.items():
+                    if state.get('is_timer_running', 'False') != 'True':
+                        continue
+                    # ✅ Czas liczony wzorem z kotwicy - tick nie zapisuje nic do bazy
+                    time_left = compute_time_left(state, now)
+                    log_sampled(timer_log, ('tick', event_id), logging.DEBUG, "⏱️  Tick -> event_%s: %.1fs left (speed: x%s)",
+                                event_id, time_left, state.get('time_speed', 1))
+                    if time_left <= 0:
+                        expired.append(event_id)
+                    elif now - last_resync.get(event_id, 0) >= TIMER_RESYNC_INTERVAL:
+                        resyncs.append((event_id, build_timer_state(event_id, state)))
+                        last_resync[event_id] = now
                 
-                for event_id in event_ids:
-                    is_running = get_game_state(event_id, 'is_timer_running', 'False')
-                    
-                    if is_running == 'True':
-                        # Pobierz time_speed dla tego eventu
-                        time_speed = int(get_game_state(event_id, 'time_speed', 1))
-                        
-                        # Oblicz ile czasu upłynęło od ostatniego tick'a
-                        if event_id in last_tick_times:
-                            elapsed_real_time = (current_time - last_tick_times[event_id]).total_seconds()
-                        else:
-                            elapsed_real_time = 1.0  # Pierwszy tick
-                        
-                        last_tick_times[event_id] = current_time
-                        
-                        # Oblicz ile czasu "game time" upłynęło (uwzględniając prędkość)
-                        elapsed_game_time = elapsed_real_time * time_speed
-                        
-                        # Pobierz aktualny game_end_time
-                        end_time_str = get_game_state(event_id, 'game_end_time')
-                        if end_time_str:
-                            end_time = datetime.fromisoformat(end_time_str)
-                            
-                            # Nowy end_time = stary end_time - (elapsed_game_time - elapsed_real_time)
-                            # To powoduje, że czas "przyspiesza"
-                            time_adjustment = elapsed_game_time - elapsed_real_time
-                            new_end_time = end_time - timedelta(seconds=time_adjustment)
-                            
-                            # Zapisz nowy end_time
-                            set_game_state(event_id, 'game_end_time', new_end_time.isoformat())
-                            
-                            # Oblicz pozostały czas
-                            time_left = max(0, (new_end_time - current_time).total_seconds())
-                        else:
-                            time_left = 0
-                        
-                        state = get_full_game_state(event_id)
-                        room_name = f'event_{event_id}'
-                        
-                        # Emit timer tick
-                        socketio.emit('timer_tick', {
-                            'time_left': time_left,
-                            'time_elapsed': state['time_elapsed'],
-                            'time_elapsed_with_pauses': state['time_elapsed_with_pauses']
-                        }, room=room_name)
-                        
-                        if event_ids:  # Log tylko jeśli są aktywne eventy
-                            print(f"⏱️  Tick -> {room_name}: {time_left:.1f}s left (speed: x{time_speed})")
-                        
-                        # Sprawdź czy czas minął
-                        if time_left <= 0:
-                            print(f"⏰ TIME'S UP for event {event_id}!")
-                            set_game_state(event_id, 'game_active', 'False')
-                            set_game_state(event_id, 'is_timer_running', 'False')
-                            emit_full_state_update(room_name)
-                            socketio.emit('game_over', {}, room=room_name)
-                            # Usuń z last_tick_times
-                            if event_id in last_tick_times:
-                                del last_tick_times[event_id]
-                    else:
-                        # Jeśli timer nie jest uruchomiony, usuń z last_tick_times
-                        if event_id in last_tick_times:
-                            del last_tick_times[event_id]
+                for event_id, payload in resyncs:
+                    socketio.emit('timer_state', payload, room=f'event_{event_id}')
+                
+                # Sprawdź czy czas minął
+                for event_id in expired:
+                    room_name = f'event_{event_id}'
+                    timer_log.info("⏰ TIME'S UP for event %s!", event_id)
+                    update_game_state(event_id, {
+                        'game_active': 'False',
+                        'is_timer_running': 'False',
+                        **timer_anchor(0)
+                    })
+                    emit_full_state_update(room_name)
+                    socketio.emit('game_over', {}, room=room_name)
                             
         except Exception as e:
-            print(f"❌ Błąd w update_timers: {e}")
-            import traceback
-            traceback.print_exc()
+            timer_log.exception("❌ Błąd w update_timers: %s", e)
+        
+        _record_tick_duration((time.perf_counter() - tick_started) * 1000, len(states))
         
         # Sleep 1 second between updates
         socketio.sleep(1)
@@ -2687,24 +3840,29 @@ def init_background_tasks():
         return
     
     _background_task_lock = True
-    print("=" * 60)
-    print("🚀 INITIALIZING BACKGROUND TASKS")
-    print("=" * 60)
+    log.info("🚀 INITIALIZING BACKGROUND TASKS")
     
     try:
-        print("📡 Starting timer background task...")
+        log.debug("📡 Starting timer background task...")
         socketio.start_background_task(target=update_timers)
+        socketio.start_background_task(target=flush_write_buffers_periodically)
+        if SOCKETIO_MESSAGE_QUEUE:
+            socketio.start_background_task(target=listen_state_cache_invalidations)
         _background_task_started = True
-        print("✅ Background task started successfully")
+        log.info("✅ Background task started successfully")
     except Exception as e:
-        print(f"❌ Error starting background task: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("❌ Error starting background task: %s", e)
     finally:
         _background_task_lock = False
 
 
 # Initialize background tasks when worker starts (for gunicorn/production)
+# Każdy worker musi mieć działający nasłuch unieważnień cache i kandydata na lidera
+# zegara, także jeśli obsługuje tylko żądania HTTP
+@app.before_request
+def ensure_background_tasks():
+    init_background_tasks()
+
 @socketio.on('connect')
 def handle_connect():
     """Called on first connection - ensures background task is running"""
@@ -2717,7 +3875,23 @@ def on_join(data):
         room = f'event_{event_id}'
         join_room(room)
         emit('game_state_update', get_full_game_state(event_id), room=request.sid)
-        emit_leaderboard_update(room)
+        emit_timer_state(event_id, to=request.sid)
+        emit_leaderboard_snapshot(event_id, to=request.sid)
+
+@socketio.on('leaderboard_resync')
+def on_leaderboard_resync(data):
+    """Klient wykrył lukę w wersjach delt - wyślij mu pełny ranking"""
+    event_id = (data or {}).get('event_id')
+    if event_id:
+        emit_leaderboard_snapshot(event_id, to=request.sid)
+
+@socketio.on('clock_sync')
+def on_clock_sync(data):
+    """Synchronizacja zegara: klient liczy przesunięcie z czasu serwera i RTT (ack)"""
+    return {
+        'client_time': (data or {}).get('client_time'),
+        'server_time': time.time() * 1000
+    }
 
 # ===================================================================
 # --- AR (Augmented Reality) Endpoints ---
@@ -2796,7 +3970,7 @@ def setup_ar_object():
 
     except Exception as e:
         db.session.rollback()
-        print(f"Błąd zapisu obiektu AR: {e}")
+        ar_log.error("Błąd zapisu obiektu AR: %s", e)
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/host/ar/object/<int:object_id>', methods=['DELETE'])
@@ -2888,15 +4062,8 @@ def recognize_ar_object():
                 # Pobierz pytanie, które gracz jeszcze nie widział
                 player_id = data.get('player_id')
                 if player_id:
-                    # Sprawdź, które pytania gracz już widział
-                    answered_ids = [ans.question_id for ans in
-                                  PlayerAnswer.query.filter_by(player_id=player_id, event_id=event_id).all()]
-
-                    # Pobierz pytanie, którego gracz jeszcze nie widział
-                    question = Question.query.filter(
-                        Question.event_id == event_id,
-                        ~Question.id.in_(answered_ids)
-                    ).order_by(db.func.random()).first()
+                    # Pobierz pytanie, którego gracz jeszcze nie widział (talia ze wszystkich kategorii)
+                    question = next_deck_question(Question, event_id, int(player_id))
 
                     if question:
                         response_data['question'] = {
@@ -2912,28 +4079,19 @@ def recognize_ar_object():
         return jsonify({'recognized': False})
 
     except Exception as e:
-        print(f"Błąd rozpoznawania AR: {e}")
-        import traceback
-        traceback.print_exc()
+        ar_log.exception("Błąd rozpoznawania AR: %s", e)
         return jsonify({'recognized': False, 'error': str(e)}), 500
 
 # Uruchomienie Aplikacji
 if __name__ == '__main__':
-    print("=" * 60)
-    print("🚀 SAPER QR APPLICATION STARTING")
-    print("=" * 60)
+    log.info("🚀 SAPER QR APPLICATION STARTING")
     
-    print("📡 Starting timer background task...")
-    socketio.start_background_task(target=update_timers)
+    init_background_tasks()
     
     port = int(os.environ.get('PORT', 5000))
     debug_mode = os.environ.get('DEBUG', 'False').lower() == 'true'
     
-    print(f"🌐 Server configuration:")
-    print(f"   - Host: 0.0.0.0")
-    print(f"   - Port: {port}")
-    print(f"   - Debug: {debug_mode}")
-    print("=" * 60)
+    log.info("🌐 Server configuration: host=0.0.0.0, port=%s, debug=%s", port, debug_mode)
     
     socketio.run(app, host='0.0.0.0', port=port, debug=debug_mode, allow_unsafe_werkzeug=True)
 
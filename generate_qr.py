@@ -1,31 +1,45 @@
-import qrcode
+# Generuje kody QR eventu do plików PNG (i opcjonalnie arkusz PDF do druku) bez
+# uruchamiania serwera. Identyfikatory są takie same jak w bazie (bialy, zolty,
+# czerwony1, ...), a kod zawiera adres <base-url>/player/<event>/<identyfikator>.
+# Przykład:
+#   python generate_qr.py --base-url https://saper.example.com --event 1 --red 10 --green 5 --sheet
+import argparse
 import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 
-# Tworzymy folder qrcodes, jeśli nie istnieje
-if not os.path.exists('qrcodes'):
-    os.makedirs('qrcodes')
+from qr_render import ONE_TIME_QR_PREFIXES, qr_identifiers, qr_label, render_qr_image, render_sheet_page, pages_to_pdf
 
-# Generujemy 10 zwykłych kodów QR
-for i in range(1, 11):
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(f'qr{i}')
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="black", back_color="white")
-    img.save(f'qrcodes/qr{i}.png')
+def main():
+    parser = argparse.ArgumentParser(description='Generowanie kodów QR eventu')
+    parser.add_argument('--base-url', required=True, help='adres aplikacji, np. https://saper.example.com')
+    parser.add_argument('--event', type=int, default=1, help='id eventu')
+    for color in ONE_TIME_QR_PREFIXES:
+        parser.add_argument(f"--{color.replace('_', '-')}", type=int, default=0, dest=color,
+                            help=f'liczba kodów {ONE_TIME_QR_PREFIXES[color]}N')
+    parser.add_argument('--sheet', action='store_true', help='dodatkowo arkusz PDF A4 do druku')
+    parser.add_argument('--out', default='qrcodes', help='folder docelowy')
+    args = parser.parse_args()
 
-# Generujemy 2 specjalne kody QR
-for i in range(1, 3):
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(f'special{i}')
-    qr.make(fit=True)
-    img = qr.make_image(fill_color="blue", back_color="white")
-    img.save(f'qrcodes/special{i}.png')
+    out_dir = os.path.join(args.out, f'event{args.event}')
+    os.makedirs(out_dir, exist_ok=True)
 
-# Generujemy czerwoną bombę
-qr = qrcode.QRCode(version=1, box_size=10, border=5)
-qr.add_data('red_bomb')
-qr.make(fit=True)
-img = qr.make_image(fill_color="red", back_color="white")
-img.save('qrcodes/red_bomb.png')
+    codes = qr_identifiers({color: getattr(args, color) for color in ONE_TIME_QR_PREFIXES})
+    entries = [(f"{args.base_url.rstrip('/')}/player/{args.event}/{identifier}", identifier) for identifier, _ in codes]
+    for data, identifier in entries:
+        with open(os.path.join(out_dir, f'{identifier}.png'), 'wb') as f:
+            f.write(render_qr_image(data))
 
-print("Wygenerowano kody QR w folderze 'qrcodes'")
\ No newline at end of file
+    if args.sheet:
+        per_page = 12
+        chunks = [[(data, qr_label(identifier)) for data, identifier in entries[i:i + per_page]]
+                  for i in range(0, len(entries), per_page)]
+        with ProcessPoolExecutor() as pool:
+            pages = list(pool.map(partial(render_sheet_page, os.path.join(args.out, '.cache')), chunks))
+        with open(os.path.join(out_dir, f'kody_qr_event{args.event}.pdf'), 'wb') as f:
+            f.write(pages_to_pdf(pages))
+
+    print(f"Wygenerowano {len(entries)} kodów QR w folderze '{out_dir}'")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+# Kody QR: schemat identyfikatorów i renderowanie obrazów / arkuszy do druku.
+# Moduł nie importuje aplikacji - używają go app.py (strony arkuszy w puli wątków
+# gevent) oraz generate_qr.py (strony w puli procesów).
+import hashlib
+import io
+import os
+import re
+import struct
+import tempfile
+import zlib
+
+try:
+    import qrcode
+    import qrcode.image.svg
+    from PIL import Image, ImageDraw, ImageFont
+    QRCODE_AVAILABLE = True
+except ImportError:
+    QRCODE_AVAILABLE = False
+
+# Kody wielorazowe (po jednym na event) i prefiksy kodów jednorazowych (czerwony1, czerwony2, ...)
+REUSABLE_QR_CODES = {'white': 'bialy', 'yellow': 'zolty'}
+ONE_TIME_QR_PREFIXES = {'red': 'czerwony', 'white_trap': 'pulapka', 'green': 'zielony', 'pink': 'rozowy'}
+
+QR_RENDER_VERSION = 1  # zmiana wyglądu kodów = nowe klucze cache
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+
+# Arkusz A4 przy 150 dpi
+SHEET_DPI = 150
+SHEET_SIZE = (1240, 1754)
+SHEET_MARGIN = 60
+
+def qr_identifiers(counts):
+    """[(identyfikator, kolor)] wszystkich kodów eventu dla {kolor: liczba kodów jednorazowych}"""
+    codes = [(identifier, color) for color, identifier in REUSABLE_QR_CODES.items()]
+    for color, prefix in ONE_TIME_QR_PREFIXES.items():
+        codes.extend((f"{prefix}{i}", color) for i in range(1, counts.get(color, 0) + 1))
+    return codes
+
+def qr_label(identifier):
+    """Podpis pod kodem: 'czerwony12' -> 'Czerwony 12'"""
+    match = re.fullmatch(r'(\D+)(\d*)', identifier)
+    if not match:
+        return identifier
+    name, number = match.groups()
+    return f"{name.capitalize()} {number}".strip()
+
+def qr_cache_key(data, fmt, fill='#000000', back='#ffffff'):
+    content = f"{QR_RENDER_VERSION}|{fmt}|{QR_BOX_SIZE}|{QR_BORDER}|{fill}|{back}|{data}"
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def render_qr_image(data, fmt='png', fill='#000000', back='#ffffff'):
+    """Bajty obrazu PNG lub SVG z zakodowanym tekstem"""
+    qr = qrcode.QRCode(box_size=QR_BOX_SIZE, border=QR_BORDER,
+                       error_correction=qrcode.constants.ERROR_CORRECT_M)
+    qr.add_data(data)
+    qr.make(fit=True)
+    if fmt == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.path.set('fill', fill)
+        return img.to_string(encoding='unicode').encode('utf-8')
+    img = qr.make_image(fill_color=fill, back_color=back)
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def cached_qr_image(cache_dir, data, fmt='png', fill='#000000', back='#ffffff'):
+    """(ścieżka, klucz) obrazu w cache na dysku - renderowany tylko przy pierwszym użyciu"""
+    key = qr_cache_key(data, fmt, fill, back)
+    path = os.path.join(cache_dir, key[:2], f"{key}.{fmt}")
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(render_qr_image(data, fmt, fill, back))
+        os.replace(tmp_path, path)  # równoległe zapisy tego samego pliku są nieszkodliwe
+    return path, key
+
+def render_sheet_page(cache_dir, entries, cols=3, rows=4):
+    """Jedna strona arkusza (PNG) z kodami [(dane, podpis)] w siatce cols x rows"""
+    page = Image.new('RGB', SHEET_SIZE, 'white')
+    draw = ImageDraw.Draw(page)
+    font = ImageFont.load_default(size=28)
+    cell_w = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // cols
+    cell_h = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // rows
+    qr_size = min(cell_w, cell_h - 50) - 20
+    for index, (data, label) in enumerate(entries[:cols * rows]):
+        x = SHEET_MARGIN + (index % cols) * cell_w
+        y = SHEET_MARGIN + (index // cols) * cell_h
+        path, _ = cached_qr_image(cache_dir, data)
+        with Image.open(path) as qr_img:
+            page.paste(qr_img.convert('RGB').resize((qr_size, qr_size), Image.NEAREST),
+                       (x + (cell_w - qr_size) // 2, y + 10))
+        text_w = draw.textlength(label, font=font)
+        draw.text((x + (cell_w - text_w) / 2, y + qr_size + 15), label, fill='black', font=font)
+    buffer = io.BytesIO()
+    page.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+def _png_image_data(page):
+    """(szerokość, wysokość, skompresowane dane IDAT) strony PNG RGB 8 bit bez przeplotu"""
+    if page[:8] != b'\x89PNG\r\n\x1a\n':
+        raise ValueError('Strona arkusza nie jest plikiem PNG')
+    offset, idat, header = 8, [], None
+    while offset < len(page):
+        length, chunk_type = struct.unpack('>I4s', page[offset:offset + 8])
+        chunk = page[offset + 8:offset + 8 + length]
+        if chunk_type == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif chunk_type == b'IDAT':
+            idat.append(chunk)
+        elif chunk_type == b'IEND':
+            break
+        offset += length + 12
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if (bit_depth, color_type, interlace) != (8, 2, 0):
+        raise ValueError('Strona arkusza musi być PNG RGB 8 bit bez przeplotu')
+    return width, height, b''.join(idat)
+
+def pages_to_pdf(pages):
+    """Wielostronicowy PDF ze stron PNG (dowolny iterator). Strony nie są dekodowane:
+    dane IDAT trafiają do PDF bez zmian (FlateDecode z predyktorem PNG), a każda
+    strona jest dopisywana od razu - w pamięci jest tylko wynikowy PDF."""
+    out = io.BytesIO()
+    offsets = {}
+
+    def write_object(number, body, stream=None):
+        offsets[number] = out.tell()
+        out.write(b'%d 0 obj\n' % number + body)
+        if stream is not None:
+            out.write(b'\nstream\n' + stream + b'\nendstream')
+        out.write(b'\nendobj\n')
+
+    out.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+    write_object(1, b'<< /Type /Catalog /Pages 2 0 R >>')
+    kids = []
+    number = 3
+    for page in pages:
+        width, height, data = _png_image_data(page)
+        page_w, page_h = width * 72 / SHEET_DPI, height * 72 / SHEET_DPI
+        write_object(number, (
+            b'<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB '
+            b'/BitsPerComponent 8 /Filter /FlateDecode '
+            b'/DecodeParms << /Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns %d >> /Length %d >>'
+        ) % (width, height, width, len(data)), data)
+        content = zlib.compress(b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q' % (page_w, page_h))
+        write_object(number + 1, b'<< /Filter /FlateDecode /Length %d >>' % len(content), content)
+        write_object(number + 2, (
+            b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] '
+            b'/Resources << /XObject << /Im0 %d 0 R >> >> /Contents %d 0 R >>'
+        ) % (page_w, page_h, number, number + 1))
+        kids.append(b'%d 0 R' % (number + 2))
+        number += 3
+    write_object(2, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (b' '.join(kids), len(kids)))
+
+    xref_offset = out.tell()
+    out.write(b'xref\n0 %d\n0000000000 65535 f \n' % number)
+    for object_number in range(1, number):
+        out.write(b'%010d 00000 n \n' % offsets[object_number])
+    out.write(b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (number, xref_offset))
+    return out.getvalue()
@@ -0,0 +1,74 @@
+// Zegar gry interpolowany lokalnie.
+// Serwer wysyła 'timer_state' tylko przy zmianie (start, pauza, prędkość, korekta czasu)
+// oraz rzadki resync co kilkanaście sekund. Przesunięcie zegara klienta względem serwera
+// liczone jest przy połączeniu przez 'clock_sync' (jak w NTP: połowa czasu RTT).
+class GameClock {
+    constructor(socket, onRender, renderInterval = 250) {
+        this.socket = socket;
+        this.onRender = onRender;
+        this.offset = 0;        // serwer - klient (ms)
+        this.bestRtt = Infinity;
+        this.state = null;
+        this.receivedAt = 0;    // czas serwera (ms), dla którego obowiązuje this.state
+
+        socket.on('connect', () => this.sync());
+        socket.on('timer_state', (state) => this.apply(state));
+        if (socket.connected) this.sync();
+
+        setInterval(() => this.render(), renderInterval);
+    }
+
+    // Kilka próbek - zostaje ta z najkrótszym RTT (najmniejszy błąd)
+    sync(samples = 3) {
+        this.bestRtt = Infinity;
+        for (let i = 0; i < samples; i++) {
+            const clientTime = Date.now();
+            this.socket.emit('clock_sync', { client_time: clientTime }, (response) => {
+                const now = Date.now();
+                const rtt = now - clientTime;
+                if (response && rtt < this.bestRtt) {
+                    this.bestRtt = rtt;
+                    this.offset = response.server_time - (clientTime + rtt / 2);
+                }
+            });
+        }
+    }
+
+    serverNow() {
+        return Date.now() + this.offset;
+    }
+
+    apply(state) {
+        this.state = state;
+        this.receivedAt = state.server_time;
+        this.render();
+    }
+
+    hasState() {
+        return this.state !== null;
+    }
+
+    elapsedSinceState() {
+        return Math.max(0, (this.serverNow() - this.receivedAt) / 1000);
+    }
+
+    timeLeft() {
+        if (!this.state || !this.state.game_active) return 0;
+        if (!this.state.running) return Math.max(0, this.state.time_left);
+        return Math.max(0, this.state.time_left - this.elapsedSinceState() * this.state.speed);
+    }
+
+    timeElapsed() {
+        if (!this.state) return 0;
+        return this.state.time_elapsed + (this.state.running ? this.elapsedSinceState() : 0);
+    }
+
+    timeElapsedWithPauses() {
+        if (!this.state) return 0;
+        return this.state.time_elapsed_with_pauses + (this.state.game_active ? this.elapsedSinceState() : 0);
+    }
+
+    render() {
+        if (this.state && this.onRender) this.onRender(this);
+    }
+}
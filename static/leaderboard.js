@@ -0,0 +1,47 @@
+// Ranking składany z komunikatów serwera.
+// Przy dołączeniu do pokoju serwer wysyła pełny 'leaderboard_snapshot', potem tylko
+// 'leaderboard_delta' (gracze ze zmienionym wynikiem/miejscem i usunięci).
+// Wersje delt są wspólne dla wszystkich workerów serwera. Gdy wersja delty nie jest
+// kolejną po naszej (zgubiony komunikat), prosimy o nowy snapshot przez 'leaderboard_resync'.
+class Leaderboard {
+    constructor(socket, eventId, onRender) {
+        this.socket = socket;
+        this.eventId = eventId;
+        this.onRender = onRender;
+        this.players = new Map();   // id -> {id, name, score, rank}
+        this.version = null;
+        this.resyncPending = false;
+
+        socket.on('leaderboard_snapshot', (snapshot) => this.applySnapshot(snapshot));
+        socket.on('leaderboard_delta', (delta) => this.applyDelta(delta));
+    }
+
+    applySnapshot(snapshot) {
+        this.players = new Map(snapshot.players.map(p => [p.id, p]));
+        this.version = snapshot.version;
+        this.resyncPending = false;
+        this.render();
+    }
+
+    applyDelta(delta) {
+        if (this.version === null || this.resyncPending) return;  // czekamy na snapshot
+        if (delta.version <= this.version) return;  // stara delta
+        if (delta.version !== this.version + 1) {
+            this.resyncPending = true;
+            this.socket.emit('leaderboard_resync', { event_id: this.eventId });
+            return;
+        }
+        delta.removed.forEach(id => this.players.delete(id));
+        delta.changes.forEach(p => this.players.set(p.id, p));
+        this.version = delta.version;
+        this.render();
+    }
+
+    sorted() {
+        return Array.from(this.players.values()).sort((a, b) => a.rank - b.rank);
+    }
+
+    render() {
+        if (this.onRender) this.onRender(this.sorted());
+    }
+}
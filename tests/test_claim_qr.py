@@ -0,0 +1,88 @@
+# Równoczesne skany jednego kodu jednorazowego: claim_qr_code() to jeden warunkowy
+# UPDATE, więc kod dostaje dokładnie jeden gracz, a reszta dostaje 403.
+# Uruchomienie: python -m pytest tests
+import os
+import tempfile
+
+# app.py czyta DATABASE_URL przy imporcie - osobna baza SQLite na czas testów
+_db_dir = tempfile.mkdtemp(prefix='saper-test-')
+os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(_db_dir, 'test.sqlite3')
+
+import gevent
+from gevent.event import Event as GeventEvent
+import pytest
+
+import app as saper
+
+CLAIMS = 100
+
+
+@pytest.fixture
+def red_code():
+    """Aktywna gra w evencie 1, jeden czerwony kod i CLAIMS graczy"""
+    with saper.app.app_context():
+        saper.update_game_state(1, {'game_active': 'True'})
+        saper.QRCode.query.filter_by(event_id=1).delete()
+        saper.Player.query.filter_by(event_id=1).delete()
+        qr = saper.QRCode(event_id=1, code_identifier='czerwony1', color='red')
+        players = [saper.Player(name=f'gracz{i}', event_id=1) for i in range(CLAIMS)]
+        saper.db.session.add(qr)
+        saper.db.session.add_all(players)
+        saper.db.session.commit()
+        saper.invalidate_event_catalog(1)
+        saper.drop_leaderboard(1)
+        ids = qr.id, [player.id for player in players]
+    return ids
+
+
+def _run_concurrently(func, args):
+    """Startuje wszystkie greenlety naraz (wspólny sygnał startu) i zwraca ich wyniki"""
+    start = GeventEvent()
+
+    def worker(arg):
+        start.wait()
+        return func(arg)
+
+    jobs = [gevent.spawn(worker, arg) for arg in args]
+    gevent.sleep(0)
+    start.set()
+    gevent.joinall(jobs, raise_error=True)
+    return [job.value for job in jobs]
+
+
+def test_concurrent_claims_have_one_winner(red_code):
+    qr_code_id, player_ids = red_code
+
+    def claim(player_id):
+        with saper.app.app_context():
+            won = saper.claim_qr_code(qr_code_id, player_id)
+            if won:
+                saper.db.session.commit()
+            else:
+                saper.db.session.rollback()
+            return won
+
+    results = _run_concurrently(claim, player_ids)
+
+    assert results.count(True) == 1
+    with saper.app.app_context():
+        claimed_by = saper.db.session.get(saper.QRCode, qr_code_id).claimed_by_player_id
+    assert claimed_by == player_ids[results.index(True)]
+
+
+def test_concurrent_scans_reject_all_but_one(red_code):
+    _, player_ids = red_code
+
+    def scan(player_id):
+        client = saper.app.test_client()
+        return client.post('/api/player/scan_qr', json={
+            'player_id': player_id, 'qr_code': 'czerwony1', 'event_id': 1
+        }).status_code
+
+    statuses = _run_concurrently(scan, player_ids)
+
+    assert statuses.count(200) == 1
+    assert statuses.count(403) == CLAIMS - 1
+    with saper.app.app_context():
+        scored = saper.Player.query.filter(saper.Player.event_id == 1, saper.Player.score != 0).count()
+    assert scored == 1